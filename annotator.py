@@ -2,6 +2,9 @@
 # python2
 
 # Attribution mapping:
+# Every frame has one bit per attribute of the schema (see labels.py),
+# by default 1 -> Occlusion, 2 -> Deformation, 4 -> Blur.
+# The mat files keep the legacy codes:
 # 0 -> Not annotated
 # 1 -> Occlusion
 # 2 -> Deformation
@@ -9,94 +12,597 @@
 # 4 -> Occlusion + Blur
 
 from __future__ import print_function
-import re
 import sys
+import time
 import os.path
-from PyQt4 import QtCore, QtGui, uic
+import threading
+import importreport
+if '--import-report' in sys.argv:
+    # Time the imports below
+    importreport.install()
+from PyQt4 import QtCore, QtGui
 from PyQt4.QtCore import Qt
-import numpy as np
-from PIL import Image
-from PIL.ImageQt import ImageQt
-from scipy.io import loadmat, savemat
+from uicache import loadUiType
+from prefetch import PagePrefetcher
+from framecache import frameCache
+from thumbcache import ThumbnailStore
+from dataset import DatasetManifest, readFrameRange
+from labels import defaultSchema
+from loader import SequenceLoader
+from journal import openJournal
+from mirror import SequenceMirror, isRemote
+from canvas import PageCanvas
+from summary import SummaryIndex
+from segments import LabelSegments, LabelHistory
+
+
+importreport.mark('modules imported')
+
+# The form is generated once into ui_GUI.py (see uicache.py)
+qtCreatorFile = 'GUI.ui'
+uiMainWindow, QtBaseClass = loadUiType(qtCreatorFile)
+importreport.mark('form class loaded')
 
+# Modules which are only needed once a sequence opens, they are imported in
+# background after the window is shown
+heavyModules = ['PIL.Image', 'PIL.ImageQt']
 
-qtCreatorFile = 'GUI.ui'
-uiMainWindow, QtBaseClass = uic.loadUiType(qtCreatorFile)
+# How many pages are decoded ahead in the direction of paging
+prefetchPages = 2
+
+# Paint a page on a single canvas (see canvas.py) instead of one image label
+# and one button row per frame
+pageCanvas = True
+
+# Grids a page can have, [rows, columns], changed with +/- or the View menu.
+# Frames are decoded at the tile size, so bigger grids decode smaller frames.
+gridSizes = [(2, 2), (3, 3), (4, 4), (5, 5), (6, 8)]
+defaultGrid = (3, 3)
+
+# Memory budget of the decoded frame cache, in MB
+frameCacheMB = 512
+
+# Size cap of the local copy of the frames (see mirror.py), in MB, 0 disables.
+# Only datasets on a network share are mirrored.
+mirrorCapMB = 4096
+
+# Neighbours of the open sequence in the list which are read ahead, and the
+# memory they may use, in MB
+warmupNeighbours = 1
+warmupMB = 128
 
-validExt = ['jpg', 'JPG', 'jpeg', 'JPEG', 'png', 'PNG']
+# Workers rebuilding the progress summary of the sequences list at startup
+summaryJobs = 4
 
-# Some sequence has 2 ground-truth file
-specialSeq = ['Skating2', 'Jogging']
+# Attribution changes are saved after this idle delay, in ms
+autosaveDelay = 2000
+
+# Attributes which can be annotated, [short name, full name, button color]
+attrSchema = defaultSchema
 
 
 class MyApp(QtGui.QMainWindow, uiMainWindow):
 
+    # The summary of some sequences has been rebuilt in background
+    summaryRebuilt = QtCore.pyqtSignal()
+
     def __init__(self, data_root):
         QtGui.QMainWindow.__init__(self)
         uiMainWindow.__init__(self)
         self.setupUi(self)
         self.datasetRoot = os.path.join(dataRoot, 'imageFiles')
         self.attrRoot = os.path.join(dataRoot, 'annotateFiles')
+        self.cacheRoot = os.path.join(dataRoot, 'cache')
+
+        # Read small frames from the thumbnail cache (see thumbcache.py)
+        frameCache.setThumbnailStore(ThumbnailStore(
+            os.path.join(self.cacheRoot, 'thumbs'), self.datasetRoot))
 
         self.log = False
 
         # Read frame range file
         self.initFrameRange()
 
+        # Frame names and ground-truths are indexed once (see dataset.py)
+        self.manifest = DatasetManifest(
+            self.datasetRoot, self.frameRange,
+            os.path.join(self.cacheRoot, 'manifest.bin'))
+
+        # Copy the frames of the active sequences locally
+        self.mirror = None
+        if mirrorCapMB > 0 and isRemote(self.datasetRoot):
+            self.mirror = SequenceMirror(
+                self.manifest, os.path.join(self.cacheRoot, 'mirror'),
+                mirrorCapMB)
+            frameCache.setMirror(self.mirror)
+
         # Init sequence list
-        self.initSeqList()
         self.currentSeq = None
+        self.initSeqList()
 
         # Init annotator
         self.initAnnotatorWidgets()
 
         # Init control buttons
         self.initControlButtons()
+        self.initGoMenu()
+        self.initEditMenu()
 
         # Init attribution data
         self.seqAttrFile = None
         self.labels = None
+        # Runs of the labels, searched by the Go menu (see segments.py)
+        self.labelIndex = None
+        # Undo/redo log of the label changes, and the marked frame range
+        self.history = LabelHistory()
+        self.rangeStart = None
+        self.rangeEnd = None
+        self.journal = None
 
         # Init ground-truth data
         self.gts = None
 
+        # Open sequences in background
+        self.initLoader()
+
     def initFrameRange(self):
         self.frameRangeFile = os.path.join(dataRoot, 'frameRange.txt')
-        f = open(self.frameRangeFile)
-        self.frameRange = {}
-        for l in list(f):
-            raw = l.split(' ')
-            # Every line format is [frame_name, start_frame, end_frame]
-            self.frameRange[raw[0]] = [int(raw[1]), int(raw[2])]
+        self.frameRange = readFrameRange(self.frameRangeFile)
 
     def initSeqList(self):
-        self.seq_list = os.listdir(self.datasetRoot)
-        for seq in specialSeq:
-            self.seq_list.remove(seq)
-            for i in range(1, 3):
-                self.seq_list.append('%s-%d' % (seq, i))
-        self.seq_list = sorted(self.seq_list)
-        for seq in self.seq_list:
-            if seq == 'anno' or seq == 'MEEM':
-                continue
-            item = QtGui.QListWidgetItem(seq)
-            self.seqList.addItem(item)
+        # Only rescan the dataset root when its mtime changed
+        self.seq_list = self.manifest.seqNames()
+        # Progress of every sequence, read from the summary index only
+        self.summary = SummaryIndex(
+            self.attrRoot, os.path.join(self.cacheRoot, 'summary.json'),
+            attrSchema)
+        self.initSeqListControls()
+        self.refreshSeqList()
         self.seqList.itemClicked.connect(self.initSeq)
         self.seqList.itemActivated.connect(self.initSeq)
+        # Rebuild the missing and stale summaries meanwhile, the list keeps
+        # its order
+        self.summaryRebuilt.connect(self.updateSeqItems)
+        thread = threading.Thread(target=self.rebuildSummary)
+        thread.daemon = True
+        thread.start()
+
+    def initSeqListControls(self):
+        '''
+        Put the sort and filter boxes above the sequence list.
+        '''
+        self.seqSort = QtGui.QComboBox()
+        self.seqSort.addItems(['Name', 'Least complete', 'Most complete'])
+        self.seqFilter = QtGui.QComboBox()
+        self.seqFilter.addItems(['All', 'Not started', 'In progress', 'Done'])
+        controls = QtGui.QHBoxLayout()
+        for box in (self.seqSort, self.seqFilter):
+            # Keys are handled by the main window
+            box.setFocusPolicy(Qt.NoFocus)
+            box.currentIndexChanged.connect(lambda _: self.refreshSeqList())
+            controls.addWidget(box)
+        panel = QtGui.QWidget()
+        panelLayout = QtGui.QVBoxLayout(panel)
+        panelLayout.setContentsMargins(0, 0, 0, 0)
+        panelLayout.addLayout(controls)
+        self.mainLayout.removeWidget(self.seqList)
+        panelLayout.addWidget(self.seqList)
+        self.mainLayout.insertWidget(0, panel, 1)
+
+    def rebuildSummary(self):
+        '''
+        Run in a background thread.
+        '''
+        try:
+            if self.summary.rebuild(self.seq_list, summaryJobs,
+                                    processes=False):
+                self.summaryRebuilt.emit()
+        except (IOError, OSError) as e:
+            print('When rebuild the summary, %s' % e)
+
+    def refreshSeqList(self):
+        '''
+        Fill the sequence list with the completion of every sequence, in the
+        order and with the filter chosen above it. Only called when they
+        change, saves update the text of their item in place.
+        '''
+        seqs = list(self.seq_list)
+        completion = dict((seq, self.summary.completion(seq)) for seq in seqs)
+        accepted = [lambda c: True, lambda c: c == 0,
+                    lambda c: 0 < c < 1, lambda c: c >= 1]
+        accept = accepted[self.seqFilter.currentIndex()]
+        seqs = [seq for seq in seqs if accept(completion[seq])]
+        if self.seqSort.currentIndex() == 1:
+            seqs.sort(key=lambda seq: completion[seq])
+        elif self.seqSort.currentIndex() == 2:
+            seqs.sort(key=lambda seq: -completion[seq])
+
+        self.seqList.clear()
+        # seq -> item of the sequences in the list
+        self.seqItems = {}
+        for seq in seqs:
+            item = QtGui.QListWidgetItem()
+            # The text changes with the progress, the name is kept aside
+            item.setData(Qt.UserRole, seq)
+            self.updateSeqItem(seq, item)
+            self.seqList.addItem(item)
+            self.seqItems[seq] = item
+            if seq == self.currentSeq:
+                self.seqList.setCurrentItem(item)
+
+    def updateSeqItem(self, seq, item=None):
+        '''
+        Show the completion of a sequence in its item, which keeps its place
+        in the list even if it no longer matches the filter.
+        '''
+        if item is None:
+            item = self.seqItems.get(seq)
+            if item is None:
+                # Filtered out
+                return
+        entry = self.summary.get(seq)
+        if entry is None:
+            item.setText(seq)
+            item.setToolTip('Not started')
+            return
+        completion = self.summary.completion(seq)
+        item.setText('%s  %d%%' % (seq, int(100 * completion)))
+        item.setToolTip('%d/%d frames annotated, %s\nSaved %s' % (
+            entry['annotated'], entry['frames'],
+            ', '.join('%s: %d' % (name, entry['counts'].get(short, 0))
+                      for short, name, _ in attrSchema),
+            time.strftime('%Y-%m-%d %H:%M',
+                          time.localtime(entry['stamp'][0]))))
+
+    def updateSeqItems(self):
+        for seq in self.seqItems:
+            self.updateSeqItem(seq)
 
     def initAnnotatorWidgets(self):
-        self.imageRow = 3
-        self.imageCol = 3
+        self.imageRow, self.imageCol = defaultGrid
         self.pageSize = self.imageRow * self.imageCol
+        # Every annotator widget created so far, the first pageSize ones are
+        # shown, the others are kept for bigger grids
+        self.widgetPool = []
         self.annotatorWidgets = []
-        for i in range(self.imageRow):
-            for j in range(self.imageCol):
-                annotatorWidget = AnnotatorWidget()
-                self.annotatorWidgets.append(annotatorWidget)
-                self.imageLayout.addWidget(annotatorWidget, i, j)
+        self.canvas = None
+        if pageCanvas:
+            self.canvas = PageCanvas(self.imageRow, self.imageCol, attrSchema)
+            self.canvas.frameClicked.connect(self.showFrameWindow)
+            self.canvas.labelChanged.connect(self.onLabelChanged)
+            self.imageLayout.addWidget(self.canvas, 0, 0)
+        else:
+            self.layoutAnnotatorWidgets()
         # Init index of images in certainc sequence
         self.startIdx = None
         self.endIdx = None
+        # Decode neighbour pages in background, follow the paging direction
+        self.prefetcher = PagePrefetcher(prefetchPages, self)
+        self.pageDirection = 1
+        self.initGridMenu()
+
+    def layoutAnnotatorWidgets(self):
+        '''
+        Place pageSize annotator widgets in the grid, reuse the existing ones.
+        Return the widgets which had to be created.
+        '''
+        created = []
+        while len(self.widgetPool) < self.pageSize:
+            annotatorWidget = AnnotatorWidget(schema=attrSchema)
+            annotatorWidget.labelChanged.connect(self.onLabelChanged)
+            self.widgetPool.append(annotatorWidget)
+            created.append(annotatorWidget)
+        for annotatorWidget in self.widgetPool:
+            self.imageLayout.removeWidget(annotatorWidget)
+        for annotatorWidget in self.widgetPool[self.pageSize:]:
+            annotatorWidget.hide()
+        self.annotatorWidgets = self.widgetPool[:self.pageSize]
+        for i, annotatorWidget in enumerate(self.annotatorWidgets):
+            row, col = divmod(i, self.imageCol)
+            self.imageLayout.addWidget(annotatorWidget, row, col)
+            annotatorWidget.show()
+        return created
+
+    def initGridMenu(self):
+        '''
+        Add the grid sizes, and the actions changing them, to the View menu.
+        '''
+        menu = self.menuBar().addMenu('&View')
+        # Shortcuts of the window, they work whichever widget has the focus
+        bigger = menu.addAction('More frames per page')
+        bigger.setShortcuts([QtGui.QKeySequence('+'), QtGui.QKeySequence('=')])
+        bigger.triggered.connect(lambda checked: self.changeGrid(1))
+        smaller = menu.addAction('Fewer frames per page')
+        smaller.setShortcut(QtGui.QKeySequence('-'))
+        smaller.triggered.connect(lambda checked: self.changeGrid(-1))
+        gridMenu = menu.addMenu('&Grid')
+        self.gridActions = QtGui.QActionGroup(self)
+        for rows, cols in gridSizes:
+            action = gridMenu.addAction('%d x %d' % (cols, rows))
+            action.setCheckable(True)
+            action.setChecked((rows, cols) == (self.imageRow, self.imageCol))
+            action.triggered.connect(
+                lambda checked, rows=rows, cols=cols: self.setGrid(rows, cols))
+            self.gridActions.addAction(action)
+
+    def setGrid(self, rows, cols):
+        '''
+        Show rows x cols frames per page. The page keeps its first frame, and
+        the tiles are reused.
+        '''
+        if (rows, cols) == (self.imageRow, self.imageCol):
+            return
+        self.imageRow, self.imageCol = rows, cols
+        self.pageSize = rows * cols
+        if self.canvas is not None:
+            self.canvas.setGrid(rows, cols)
+        else:
+            for annotatorWidget in self.layoutAnnotatorWidgets():
+                if self.labels is not None:
+                    annotatorWidget.initAttrButton()
+                annotatorWidget.setLabels(self.labels)
+            # Resize the tiles now, frames are decoded at their size
+            self.imageLayout.activate()
+        for action, size in zip(self.gridActions.actions(), gridSizes):
+            action.setChecked(size == (rows, cols))
+        self.statusBar().showMessage('%d x %d frames per page' % (cols, rows),
+                                     2000)
+        if self.startIdx is None:
+            return
+        self.endIdx = min(self.startIdx + self.pageSize, self.seqLen)
+        self.startIdx = max(0, self.endIdx - self.pageSize)
+        self.prevPage.setEnabled(self.startIdx > 0)
+        self.nextPage.setEnabled(self.endIdx < self.seqLen)
+        self.showImages()
+        if self.labels is not None:
+            self.showAttrData()
+
+    def changeGrid(self, step):
+        '''
+        Switch to the next bigger (step 1) or smaller (step -1) grid size.
+        '''
+        sizes = [rows * cols for rows, cols in gridSizes]
+        if step > 0:
+            bigger = [i for i, n in enumerate(sizes) if n > self.pageSize]
+            if bigger:
+                self.setGrid(*gridSizes[bigger[0]])
+        else:
+            smaller = [i for i, n in enumerate(sizes) if n < self.pageSize]
+            if smaller:
+                self.setGrid(*gridSizes[smaller[-1]])
+
+    def initGoMenu(self):
+        '''
+        Add the searches of the labels to the Go menu. Their shortcuts belong
+        to the window, so they work whichever widget has the focus.
+        '''
+        menu = self.menuBar().addMenu('&Go')
+        entries = [('Next unannotated frame', 'N', self.nextUnannotated, 1),
+                   ('Previous unannotated frame', 'Shift+N',
+                    self.nextUnannotated, -1),
+                   ('Next label change', 'C', self.nextLabelChange, 1),
+                   ('Previous label change', 'Shift+C',
+                    self.nextLabelChange, -1), None]
+        for i, (_, name, _) in enumerate(attrSchema):
+            # Shift+digit gives another key on most layouts, use Alt
+            entries += [('Next frame with %s' % name, '%d' % (i + 1),
+                         lambda step, i=i: self.nextWithAttr(i, step), 1),
+                        ('Previous frame with %s' % name, 'Alt+%d' % (i + 1),
+                         lambda step, i=i: self.nextWithAttr(i, step), -1)]
+        for entry in entries:
+            if entry is None:
+                menu.addSeparator()
+                continue
+            text, key, method, step = entry
+            action = menu.addAction(text)
+            action.setShortcut(QtGui.QKeySequence(key))
+            action.triggered.connect(
+                lambda checked, method=method, step=step: method(step))
+
+    def initEditMenu(self):
+        '''
+        Add undo/redo and the range operations to the Edit menu, with window
+        shortcuts like the Go menu.
+        '''
+        menu = self.menuBar().addMenu('&Edit')
+        entries = [('Undo', ['Ctrl+Z'], self.undo),
+                   ('Redo', ['Ctrl+Y', 'Ctrl+Shift+Z'], self.redo), None,
+                   ('Mark range start', ['['], lambda: self.markRange(False)),
+                   ('Mark range end', [']'], lambda: self.markRange(True)),
+                   ('Clear range marks', [], self.clearRangeMarks), None]
+        entries += [('Toggle %s on range' % name, ['Ctrl+%d' % (i + 1)],
+                     lambda i=i: self.toggleRangeAttr(i))
+                    for i, (_, name, _) in enumerate(attrSchema)]
+        entries.append(('Clear attributes of range', ['Ctrl+0'],
+                        self.clearRangeAttrs))
+        for entry in entries:
+            if entry is None:
+                menu.addSeparator()
+                continue
+            text, keys, method = entry
+            action = menu.addAction(text)
+            action.setShortcuts([QtGui.QKeySequence(key) for key in keys])
+            action.triggered.connect(
+                lambda checked, method=method: method())
+
+    def frameUnderCursor(self):
+        '''
+        Return the index of the frame under the mouse, or None.
+        '''
+        if self.canvas is not None:
+            hit = self.canvas.hitTest(
+                self.canvas.mapFromGlobal(QtGui.QCursor.pos()))
+            if hit is None:
+                return None
+            return self.canvas.tiles[hit[0]].frameIdx
+        for annotatorWidget in self.annotatorWidgets:
+            pos = annotatorWidget.mapFromGlobal(QtGui.QCursor.pos())
+            if annotatorWidget.rect().contains(pos):
+                return annotatorWidget.frameID
+        return None
+
+    def markRange(self, end):
+        '''
+        Mark the frame under the mouse as the start or the end of the range,
+        the first or last frame of the page if the mouse is not on a frame.
+        The ends can be on different pages.
+        '''
+        if self.labels is None:
+            return
+        frameIdx = self.frameUnderCursor()
+        if frameIdx is None:
+            frameIdx = self.endIdx - 1 if end else self.startIdx
+        if end:
+            self.rangeEnd = frameIdx
+        else:
+            self.rangeStart = frameIdx
+        self.showRangeMarks()
+
+    def clearRangeMarks(self):
+        self.rangeStart = None
+        self.rangeEnd = None
+        self.showRangeMarks()
+
+    def markedRange(self):
+        '''
+        Return [start, end) of the marked frames, or None.
+        '''
+        if self.rangeStart is None or self.rangeEnd is None:
+            return None
+        first, last = sorted((self.rangeStart, self.rangeEnd))
+        return first, last + 1
+
+    def showRangeMarks(self):
+        marked = self.markedRange()
+        if marked is None:
+            first = last = self.rangeStart if self.rangeStart is not None \
+                else self.rangeEnd
+        else:
+            first, last = marked[0], marked[1] - 1
+        if self.canvas is not None:
+            self.canvas.setMarked(first, last)
+        if marked is not None:
+            self.statusBar().showMessage('Range: frames %d-%d (%d frames)' % (
+                marked[0] + 1, marked[1], marked[1] - marked[0]))
+        elif first is not None:
+            self.statusBar().showMessage('Range: frame %d marked' %
+                                         (first + 1))
+        else:
+            self.statusBar().clearMessage()
+
+    def changeRange(self, change):
+        '''
+        Replace the bits v of every marked frame by change(v). Whole runs are
+        assigned at once, and the change is recorded as runs in the history.
+        '''
+        marked = self.markedRange()
+        if self.labels is None or marked is None:
+            self.statusBar().showMessage('Mark the start and the end of a '
+                                         'range first: [ and ]', 3000)
+            return
+        before = self.labelIndex.slice(*marked)
+        after = [(start, end, change(value)) for start, end, value in before]
+        if after == before:
+            return
+        self.history.record(before, after)
+        self.applyRuns(after)
+
+    def toggleRangeAttr(self, attr):
+        '''
+        Remove the attribute from the range if every frame of it has it,
+        add it to every frame otherwise.
+        '''
+        marked = self.markedRange()
+        if self.labelIndex is not None and marked is not None and \
+                all(value & (1 << attr)
+                    for _, _, value in self.labelIndex.slice(*marked)):
+            self.changeRange(lambda value: value & ~(1 << attr))
+        else:
+            self.changeRange(lambda value: value | 1 << attr)
+
+    def clearRangeAttrs(self):
+        self.changeRange(lambda value: 0)
+
+    def undo(self):
+        if self.labels is not None:
+            self.applyRuns(self.history.undo())
+
+    def redo(self):
+        if self.labels is not None:
+            self.applyRuns(self.history.redo())
+
+    def applyRuns(self, runs):
+        '''
+        Set the labels of [(start, end, value)] runs, and show the first one.
+        '''
+        if not runs:
+            return
+        for start, end, value in runs:
+            self.labels[start:end] = value
+            self.labelIndex.assign(start, end, value)
+        if not self.startIdx <= runs[0][0] < self.endIdx:
+            self.showFrame(runs[0][0])
+        else:
+            self.showAttrData()
+        # The next save writes every run even if the journal misses some
+        self.autosaveTimer.start()
+        try:
+            for start, end, value in runs:
+                self.journal.appendRange(start, end, value)
+        except (IOError, OSError) as e:
+            self.onLoadFailed(-1, 'When write journal, %s' % e)
+            return
+        self.saveState.setStyleSheet('')
+        self.saveState.setText('Unsaved changes')
+
+    def findFrame(self, match, step, what):
+        '''
+        Show the first frame after the page (step 1), or the last one before
+        it (step -1), whose bits satisfy `match`.
+        '''
+        if self.labelIndex is None:
+            return
+        if step > 0:
+            frameIdx = self.labelIndex.find(self.endIdx - 1, match, 1)
+        else:
+            frameIdx = self.labelIndex.find(self.startIdx, match, -1)
+        if frameIdx is None or frameIdx >= self.seqLen:
+            # Labels saved past the last frame are kept but not shown
+            self.statusBar().showMessage('No %s %s this page' % (
+                what, 'after' if step > 0 else 'before'), 3000)
+            return
+        self.showFrame(frameIdx)
+        self.statusBar().showMessage('Frame %d: %s' % (frameIdx + 1, what),
+                                     3000)
+
+    def nextUnannotated(self, step=1):
+        self.findFrame(lambda values: values == 0, step, 'unannotated frame')
+
+    def nextLabelChange(self, step=1):
+        if self.labelIndex is None:
+            return
+        frameIdx = self.endIdx - 1 if step > 0 else self.startIdx
+        value = self.labelIndex.valueAt(frameIdx)
+        self.findFrame(lambda values: values != value, step, 'label change')
+
+    def nextWithAttr(self, attr, step=1):
+        bit = 1 << attr
+        self.findFrame(lambda values: (values & bit) != 0, step,
+                       'frame with %s' % attrSchema[attr][1])
+
+    def showFrame(self, frameIdx):
+        '''
+        Show the page containing frameIdx. Pages are aligned on multiples of
+        pageSize, like when paging from the first frame.
+        '''
+        self.pageDirection = 1 if frameIdx >= self.startIdx else -1
+        self.startIdx = frameIdx - frameIdx % self.pageSize
+        self.endIdx = min(self.startIdx + self.pageSize, self.seqLen)
+        self.startIdx = max(0, self.endIdx - self.pageSize)
+        self.prevPage.setEnabled(self.startIdx > 0)
+        self.nextPage.setEnabled(self.endIdx < self.seqLen)
+        self.showImages()
+        self.showAttrData()
 
     def initControlButtons(self):
         '''
@@ -114,25 +620,119 @@ class MyApp(QtGui.QMainWindow, uiMainWindow):
         self.nextSeq.keyPressEvent = lambda x: x.ignore()
         self.saveButton.setEnabled(False)
         self.saveButton.keyPressEvent = lambda x: x.ignore()
-        self.saveButton.clicked.connect(self.saveAttrData)
+        self.saveButton.clicked.connect(lambda: self.saveAttrData())
+
+    def initLoader(self):
+        '''
+        Start the background sequence loader, and the status bar widgets which
+        show its progress.
+        '''
+        self.loader = SequenceLoader(self.manifest, attrSchema, self,
+                                     warmupMB)
+        self.loader.log = self.log
+        self.loader.progress.connect(self.onLoadProgress)
+        self.loader.firstPageReady.connect(self.onFirstPageReady)
+        self.loader.labelsReady.connect(self.onLabelsReady)
+        self.loader.failed.connect(self.onLoadFailed)
+        self.loader.saved.connect(self.onSaved)
+        self.loader.summary = self.summary
+        self.loader.start()
+        self.loadGeneration = None
+
+        # Label changes are saved by the loader thread once the user is idle
+        self.autosaveTimer = QtCore.QTimer(self)
+        self.autosaveTimer.setSingleShot(True)
+        self.autosaveTimer.setInterval(autosaveDelay)
+        self.autosaveTimer.timeout.connect(lambda: self.saveAttrData())
+        self.saveState = QtGui.QLabel()
+        self.statusBar().addPermanentWidget(self.saveState)
+
+        self.loadProgress = QtGui.QProgressBar()
+        self.loadProgress.setMaximumWidth(200)
+        self.cancelLoadButton = QtGui.QPushButton('Cancel')
+        self.cancelLoadButton.keyPressEvent = lambda x: x.ignore()
+        self.cancelLoadButton.clicked.connect(self.cancelLoad)
+        self.statusBar().addPermanentWidget(self.loadProgress)
+        self.statusBar().addPermanentWidget(self.cancelLoadButton)
+        self.loadProgress.hide()
+        self.cancelLoadButton.hide()
 
     def initSeq(self, item):
         '''
-        Init and show the first page of the current sequence,
-        then read the attribution data of it.
+        Start loading the current sequence in background. Its first page is
+        shown as soon as it is decoded, then the attribution data of it.
         '''
         # If some sequence had been loaded before, the attribution changes need
         # to be saved.
         if self.currentSeq is not None:
             self.saveAttrData()
 
-        self.currentSeq = str(item.text())
+        self.currentSeq = str(item.data(Qt.UserRole).toString())
+
+        # Nothing can be paged or annotated until the new sequence is ready
+        self.resetSeqState()
+        self.loadGeneration = self.loader.load(
+            self.currentSeq, os.path.join(self.attrRoot, self.currentSeq),
+            self.pageSize, self.tileSize())
+        self.loadProgress.setValue(0)
+        self.loadProgress.show()
+        self.cancelLoadButton.show()
+
+    def resetSeqState(self):
+        '''
+        Forget the page and attribution data of the previous sequence.
+        '''
+        self.startIdx = None
+        self.endIdx = None
+        self.seqAttrFile = None
+        self.labels = None
+        self.labelIndex = None
+        self.history.clear()
+        self.rangeStart = None
+        self.rangeEnd = None
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+        for annotatorWidget in self.annotatorWidgets:
+            annotatorWidget.setLabels(None)
+        if self.canvas is not None:
+            self.canvas.setLabels(None)
+            self.canvas.setMarked(None, None)
+        self.prevPage.setEnabled(False)
+        self.nextPage.setEnabled(False)
+        self.saveButton.setEnabled(False)
+
+    def cancelLoad(self):
+        '''
+        Stop loading the current sequence.
+        '''
+        self.loader.cancel()
+        self.loadGeneration = None
+        self.currentSeq = None
+        self.resetSeqState()
+        self.loadProgress.hide()
+        self.cancelLoadButton.hide()
+        self.statusBar().showMessage('Loading cancelled', 3000)
+
+    def onLoadProgress(self, generation, done, total, message):
+        if generation != self.loadGeneration:
+            return
+        self.loadProgress.setMaximum(total)
+        self.loadProgress.setValue(done)
+        self.statusBar().showMessage('%s: %s' % (self.currentSeq, message))
 
+    def onFirstPageReady(self, generation, seqData):
+        '''
+        Show the first page of the sequence, its frames are already decoded.
+        '''
+        if generation != self.loadGeneration:
+            return
         # Get current sequence's frames and GTs
-        self.initFrameAndGT()
+        self.initFrameAndGT(seqData['entry'], seqData['gts'])
 
         # Init page indeies
         self.startIdx = 0
+        self.pageDirection = 1
         self.prevPage.setEnabled(False)
         if self.seqLen <= self.pageSize:
             self.endIdx = self.seqLen
@@ -142,14 +742,31 @@ class MyApp(QtGui.QMainWindow, uiMainWindow):
             self.nextPage.setEnabled(True)
         self.showImages()
 
-        # Read the attribution data
-        self.readAttrData()
+    def onLabelsReady(self, generation, labels):
+        if generation != self.loadGeneration:
+            return
+        self.loadGeneration = None
+        self.loadProgress.hide()
+        self.cancelLoadButton.hide()
+        self.statusBar().clearMessage()
+
+        self.seqAttrFile = os.path.join(self.attrRoot, self.currentSeq)
+        self.labels = labels
+        self.labelIndex = LabelSegments.fromArray(labels.flags)
+        # Every click is appended to the journal, the mat file is rewritten
+        # by the autosave
+        self.journal = openJournal(self.seqAttrFile)
+        if self.journal.offset() > 0:
+            # Some changes were only in the journal, compact them
+            self.autosaveTimer.start()
 
         # Set attribution button checkable, clean attribution button state and
         # pass attribution list to every annotator widget.
         for annotatorWidget in self.annotatorWidgets:
             annotatorWidget.initAttrButton()
             annotatorWidget.setLabels(self.labels)
+        if self.canvas is not None:
+            self.canvas.setLabels(self.labels)
 
         # Show the attribution data
         self.showAttrData()
@@ -157,96 +774,107 @@ class MyApp(QtGui.QMainWindow, uiMainWindow):
         # Enable save button
         self.saveButton.setEnabled(True)
 
-    def initFrameAndGT(self):
+        # The sequence is open, mirror it and the next one meanwhile
+        if self.mirror is not None:
+            self.mirror.setActive([self.currentSeq] + self.nextSeqs(1))
+
+        # Read ahead the sequences which are likely opened next
+        self.loader.warm(
+            [(seq, os.path.join(self.attrRoot, seq))
+             for seq in self.neighbourSeqs(warmupNeighbours)],
+            self.pageSize, self.tileSize())
+
+    def visibleSeqs(self):
         '''
-        Read the frames and ground-truths of current sequence.
+        Return the sequences in the order the sequence list shows them, after
+        sorting and filtering.
         '''
-        # Prepare images of current sequence
-        # First check current sequence is special or not
-        probe = self.currentSeq.split('-')
-        if len(probe) == 2:
-            # if current sequence is the special sequence
-            self.currentSeqSpecial = True
-            self.seqImgDir = os.path.join(self.datasetRoot, probe[0], 'img')
-        else:
-            self.currentSeqSpecial = False
-            self.seqImgDir = os.path.join(self.datasetRoot, self.currentSeq, 'img')
-        # Get current sequence's frame range
-        frs, fre = self.frameRange[self.currentSeq]
-
-        # Get current sequence's frame names (need filter some files)
-        self.imgNames = [fn for fn in os.listdir(self.seqImgDir) if any(
-            fn.endswith(ext) for ext in validExt)]
-        self.imgNames = sorted(self.imgNames)
-        self.firstFrame = int(self.imgNames[0].split('.')[0])
-        frs -= self.firstFrame
-        fre -= self.firstFrame
-        self.imgNames = self.imgNames[frs:fre]
-        self.seqLen = len(self.imgNames)
+        return [str(self.seqList.item(i).data(Qt.UserRole).toString())
+                for i in range(self.seqList.count())]
 
-        # Read ground-truth of this sequence
-        if self.currentSeqSpecial:
-            gtFilePath = os.path.join(
-                self.datasetRoot, probe[0], 'groundtruth_rect.%s.txt' % probe[1])
-        else:
-            gtFilePath = os.path.join(
-                self.datasetRoot, self.currentSeq, 'groundtruth_rect.txt')
-        f = open(gtFilePath)
-        seq_pattern = r'[\d]+'
-        # origin gt format is [x, y, w, h]
-        self.gts = [map(int, re.findall(seq_pattern, line))
-                    for line in list(f)]
-        gtrs, gtre = frs, fre
-        if self.currentSeq == 'David':
-            # Sequence 'David' is very special!
-            gtrs -= 299
-            gtre -= 299
-        self.gts = self.gts[gtrs:gtre]
+    def nextSeqs(self, count):
+        '''
+        Return the names of the sequences following the current one in the
+        sequence list.
+        '''
+        seqs = self.visibleSeqs()
+        if self.currentSeq not in seqs:
+            return []
+        idx = seqs.index(self.currentSeq)
+        return seqs[idx + 1:idx + 1 + count]
+
+    def neighbourSeqs(self, count):
+        '''
+        Return the sequences around the current one in the sequence list,
+        nearest first, the next one before the previous one.
+        '''
+        seqs = self.visibleSeqs()
+        if self.currentSeq not in seqs:
+            return []
+        idx = seqs.index(self.currentSeq)
+        neighbours = []
+        for offset in range(1, count + 1):
+            for i in (idx + offset, idx - offset):
+                if 0 <= i < len(seqs):
+                    neighbours.append(seqs[i])
+        return neighbours
+
+    def onLoadFailed(self, generation, message):
+        print(message)
+        if generation == -1:
+            # A save failed, keep it visible until the next successful save
+            self.saveState.setStyleSheet('QLabel { color: red }')
+            self.saveState.setText('Save failed')
+            self.saveState.setToolTip(str(message))
+            self.statusBar().showMessage(str(message), 10000)
+            return
+        if generation == self.loadGeneration:
+            self.cancelLoad()
+        self.statusBar().showMessage(str(message), 5000)
+
+    def initFrameAndGT(self, entry, gts):
+        '''
+        Set the frames and ground-truths of current sequence.
+        '''
+        self.currentSeqSpecial = len(self.currentSeq.split('-')) == 2
+        self.seqImgDir = entry['imgDir']
+        self.imgNames = entry['imgNames']
+        self.firstFrame = entry['firstFrame']
+        self.seqLen = len(self.imgNames)
+        self.prefetcher.setSequence(
+            [os.path.join(self.seqImgDir, imgName) for imgName in self.imgNames])
+        # (N, 4) array of [x, y, w, h], memory-mapped from the cache
+        self.gts = gts
 
     def showImages(self):
         '''
         Show images of the current sequence by start and end index
         '''
+        frames = []
         for i in range(self.startIdx, self.endIdx):
             imagePath = os.path.join(self.seqImgDir, self.imgNames[i])
-            bbox = self.gts[i]
-            self.annotatorWidgets[i - self.startIdx].setImage(imagePath, bbox)
+            bbox = tuple(self.gts[i])
+            frames.append((i, imagePath, bbox))
+        if self.canvas is not None:
+            # The whole page is a single repaint
+            self.canvas.setPage(frames)
+        for annotatorWidget, (i, imagePath, bbox) in zip(
+                self.annotatorWidgets, frames):
+            annotatorWidget.setImage(imagePath, bbox)
             # frameID = int(self.imgNames[i].split('.')[0]) - 1
-            self.annotatorWidgets[i - self.startIdx].setFrameID(i)
+            annotatorWidget.setFrameID(i)
         self.update()
-
-    def readAttrData(self):
-        '''
-        Read the attribution data from mat file.
-        If the file does not exist, init it by all 0.
-        '''
-        self.seqAttrFile = os.path.join(self.attrRoot, self.currentSeq)
-        try:
-            attrData = loadmat(self.seqAttrFile)['label']
-            if self.log:
-                print('Succesfully load mat file for %s' % self.currentSeq)
-            rawData = [label[0] for label in attrData]
-            rawDataLen = len(rawData)
-            if rawDataLen < self.seqLen:
-                # If some frame have not been annotated, then use 0 to fill it.
-                if self.log:
-                    print('Only %d frames of sequence %s have been annotated before.' %
-                          (rawDataLen, self.currentSeq))
-                    print('Padding the attribution data by 0')
-                self.labels = [0 for i in range(self.seqLen)]
-                for i in range(rawDataLen):
-                    self.labels[i] = rawData[i]
-            else:
-                self.labels = rawData
-        except IOError, e:
-            print('When init sequence %s, no mat file found' % self.currentSeq)
-            self.labels = [0 for i in range(self.seqLen)]
-            print('Init the attribution data by 0')
+        self.prefetcher.setPage(self.startIdx, self.endIdx, self.pageDirection,
+                                self.tileSize())
 
     def showAttrData(self):
         '''
         Show attribution data of the current sequence by start and end index
         '''
+        if self.canvas is not None:
+            # The badges are painted from the labels
+            self.canvas.update()
+            return
         try:
             for i in range(self.startIdx, self.endIdx):
                 self.annotatorWidgets[i - self.startIdx].setAttr(self.labels[i])
@@ -255,28 +883,75 @@ class MyApp(QtGui.QMainWindow, uiMainWindow):
             print('When show attribution data, ')
             print(e)
 
-    def saveAttrData(self):
+    def tileSize(self):
         '''
-        Save attribution data of the current sequence
+        Return the size a frame is displayed at, frames are decoded for it.
         '''
+        if self.canvas is not None:
+            return self.canvas.tileSize()
+        return self.annotatorWidgets[0].imageWidget.size()
+
+    def showFrameWindow(self, frameID):
+        '''
+        Show a frame of the current page at full resolution in a big window.
+        '''
+        imagePath = os.path.join(self.seqImgDir, self.imgNames[frameID])
+        frame = frameCache.load(imagePath)
+        pixmap = framePixmap(frame, tuple(self.gts[frameID]))
+        imgWindow = ImageWindow(pixmap, imagePath)
+        imgWindow.exec_()
+
+    def onLabelChanged(self, frameID, label):
+        self.history.record([(frameID, frameID + 1,
+                              self.labelIndex.valueAt(frameID))],
+                            [(frameID, frameID + 1, label)])
+        self.labelIndex.assign(frameID, frameID + 1, label)
         try:
-            if self.seqAttrFile is not None:
-                # Reshape the attribute list to matrix
-                saveData = np.array(self.labels).reshape(-1, 1)
-                # print(saveData)
-                target = self.seqAttrFile + '.mat'
-                savemat(target, {'label': saveData}, do_compression=True)
-                if self.log:
-                    print('Save to %s\n' % target)
-        except Exception, e:
-            print('When save attribution data, ')
-            print(e)
+            self.journal.append(frameID, label)
+        except (IOError, OSError) as e:
+            self.onLoadFailed(-1, 'When write journal, %s' % e)
+            self.autosaveTimer.start()
+            return
+        self.saveState.setStyleSheet('')
+        self.saveState.setText('Unsaved changes')
+        self.autosaveTimer.start()
+
+    def onSaved(self, seqAttrFile):
+        # The summary index has just been updated by the loader
+        self.updateSeqItem(os.path.relpath(seqAttrFile, self.attrRoot))
+        if self.autosaveTimer.isActive():
+            # Changed again since this save was queued
+            return
+        self.saveState.setStyleSheet('')
+        self.saveState.setToolTip('')
+        self.saveState.setText('Saved')
+
+    def saveAttrData(self):
+        '''
+        Queue the saving of attribution data of the current sequence.
+        The loader thread writes it, so saving never blocks the GUI.
+        '''
+        self.autosaveTimer.stop()
+        if self.seqAttrFile is None or not self.loader.isRunning():
+            return
+        self.loader.save(self.seqAttrFile, self.labels.copy(), self.journal)
+
+    def flushAttrData(self):
+        '''
+        Save the attribution data now, and wait for all queued saves.
+        '''
+        self.saveAttrData()
+        # The loader thread must be finished before the window is destroyed
+        self.loader.stop()
+        if self.mirror is not None:
+            self.mirror.stop()
 
     def showPrevPage(self):
         '''
         Calculate start and end index for previous page.
         Be careful when reach the head point of the sequence.
         '''
+        self.pageDirection = -1
         self.endIdx = self.startIdx
         self.startIdx = self.startIdx - self.pageSize
         if self.startIdx <= 0:
@@ -295,6 +970,7 @@ class MyApp(QtGui.QMainWindow, uiMainWindow):
         Calculate start and end index for next page.
         Be careful when reach the tail point of the sequence.
         '''
+        self.pageDirection = 1
         self.startIdx = self.endIdx
         self.endIdx = self.startIdx + self.pageSize
         if self.endIdx >= self.seqLen:
@@ -312,9 +988,17 @@ class MyApp(QtGui.QMainWindow, uiMainWindow):
         '''
         Save the attribution changes and quit.
         '''
-        self.saveAttrData()
+        self.flushAttrData()
+        if self.log:
+            print('Frame cache: %s' % frameCache.stats())
+            if self.mirror is not None:
+                print('Mirror: %s' % self.mirror.stats())
         self.close()
 
+    def closeEvent(self, e):
+        self.flushAttrData()
+        super(MyApp, self).closeEvent(e)
+
     def keyPressEvent(self, e):
         if e.key() == Qt.Key_Right and self.endIdx is not None:
             if self.endIdx != self.seqLen:
@@ -331,17 +1015,78 @@ class MyApp(QtGui.QMainWindow, uiMainWindow):
             self.saveAndQuit()
 
 
+def framePixmap(frame, bbox):
+    '''
+    Convert a decoded frame to QPixmap and draw the ground-truth on it.
+    The box is given in full resolution coordinates.
+    '''
+    pixmap = QtGui.QPixmap.fromImage(frame.image)
+    if bbox is not None:
+        # Draw ground-truth as rectangle
+        scale = frame.scale()
+        painter = QtGui.QPainter(pixmap)
+        pen = QtGui.QPen(QtGui.QColor('red'), 2)
+        painter.setPen(pen)
+        painter.drawRect(QtCore.QRectF(*[v * scale for v in bbox]))
+        painter.end()
+    return pixmap
+
+
 class ResizeImage(QtGui.QLabel):
     '''
     A widget that display a resizable image.
+
+    The scaled pixmap is kept between paint events and only recomputed when
+    the widget is resized or the source pixmap changes. While the user is
+    resizing, a fast transform is used, and a smooth pass follows once the
+    resizing stops.
     '''
 
+    # Delay (ms) after the last resize event before the smooth rescale
+    smoothDelay = 150
+
     def __init__(self, pixmap=None):
         super(ResizeImage, self).__init__()
         self.setFrameStyle(QtGui.QFrame.StyledPanel)
         self.pixmap = pixmap
         # if pixmap is not None:
         #     self.setPixmap(pixmap)
+        self.scaledPix = None
+        self.scaledKey = None
+        self.scaledSmooth = False
+        self.resizing = False
+        self.smoothTimer = QtCore.QTimer(self)
+        self.smoothTimer.setSingleShot(True)
+        self.smoothTimer.setInterval(self.smoothDelay)
+        self.smoothTimer.timeout.connect(self.resizeFinished)
+
+    def resizeEvent(self, event):
+        super(ResizeImage, self).resizeEvent(event)
+        self.resizing = True
+        self.smoothTimer.start()
+
+    def resizeFinished(self):
+        self.resizing = False
+        if not self.scaledSmooth:
+            self.update()
+
+    def scaledPixmap(self, size):
+        '''
+        Return the pixmap scaled to `size`, reuse the last result if possible.
+        '''
+        # cacheKey changes whenever the pixmap is replaced or painted on
+        key = (self.pixmap.cacheKey(), size.width(), size.height())
+        if key == self.scaledKey and (self.scaledSmooth or self.resizing):
+            return self.scaledPix
+        if self.resizing:
+            mode = Qt.FastTransformation
+        else:
+            mode = Qt.SmoothTransformation
+        self.scaledPix = self.pixmap.scaled(size, Qt.KeepAspectRatio,
+                                            transformMode=mode)
+        self.scaledKey = key
+        self.scaledSmooth = not self.resizing
+        return self.scaledPix
 
     def paintEvent(self, event):
         if self.pixmap is None:
@@ -350,8 +1095,7 @@ class ResizeImage(QtGui.QLabel):
         size = self.size()
         painter = QtGui.QPainter(self)
         point = QtCore.QPoint(0, 0)
-        scaledPix = self.pixmap.scaled(size, Qt.KeepAspectRatio,
-                                       transformMode=Qt.SmoothTransformation)
+        scaledPix = self.scaledPixmap(size)
         # start painting the label from left upper corner
         point.setX((size.width() - scaledPix.width()) / 2)
         point.setY((size.height() - scaledPix.height()) / 2)
@@ -401,6 +1145,9 @@ class ImageWidget(ResizeImage):
 
     def __init__(self, imagePath=None, bbox=None):
         super(ImageWidget, self).__init__()
+        self.imagePath = None
+        self.bbox = None
+        self.reduce = 1
         if imagePath is not None:
             self.setImage(imagePath, bbox)
             self.title = imagePath
@@ -411,50 +1158,73 @@ class ImageWidget(ResizeImage):
 
     def setImage(self, imagePath, bbox):
         '''
-        Read the image by PIL, and crop this image by input bounding box,
-        then covert the result to QPixmap format.
+        Read the image from the frame cache at a resolution close to the
+        widget size, draw the input bounding box on it, then covert the result
+        to QPixmap format.
         '''
-        self.pixmap = QtGui.QPixmap(imagePath)
+        if imagePath == self.imagePath and bbox == self.bbox:
+            # Same frame and ground-truth as before, nothing to redraw
+            return
+        self.imagePath = imagePath
+        self.bbox = bbox
         self.title = imagePath
-        if bbox is not None:
-            # Draw ground-truth as rectangle
-            painter = QtGui.QPainter(self.pixmap)
-            pen = QtGui.QPen(QtGui.QColor('red'), 2)
-            painter.setPen(pen)
-            painter.drawRect(*bbox)
+        # Prefetched frames are already in the cache, others are decoded here
+        frame = frameCache.load(imagePath, self.size())
+        self.reduce = frame.reduce
+        self.pixmap = framePixmap(frame, bbox)
+
+    def resizeFinished(self):
+        # A bigger tile may need a finer decode of the current frame
+        if self.imagePath is not None and self.reduce > 1:
+            imagePath, bbox = self.imagePath, self.bbox
+            self.imagePath = None
+            self.setImage(imagePath, bbox)
+            self.update()
+        super(ImageWidget, self).resizeFinished()
 
     def mouseReleaseEvent(self, event):
-        imgWindow = ImageWindow(self.pixmap, self.title)
+        if self.imagePath is None:
+            pixmap = self.pixmap
+        else:
+            # The big window shows the full resolution frame
+            frame = frameCache.load(self.imagePath)
+            pixmap = framePixmap(frame, self.bbox)
+        imgWindow = ImageWindow(pixmap, self.title)
         imgWindow.exec_()
 
 
 class AnnotatorWidget(QtGui.QWidget):
     '''
     A widget display the annotated frame image and annotated buttons.
+    There is one check button per attribute of the schema, any combination of
+    attributes can be checked.
     '''
 
-    def __init__(self, frameID=None, labels=None):
+    # frame index, new attribution
+    labelChanged = QtCore.pyqtSignal(int, int)
+
+    def __init__(self, frameID=None, labels=None, schema=defaultSchema):
         super(AnnotatorWidget, self).__init__()
         self.frameID = frameID
         self.labels = labels
         self.layout = QtGui.QVBoxLayout()
         self.imageWidget = ImageWidget()
 
-        # Init annotator buttons
+        # Init annotator buttons, the id of a button is its attribute bit
         self.buttonLayout = QtGui.QHBoxLayout()
         self.buttonLayout.setSpacing(0)
         self.buttonGroup = QtGui.QButtonGroup()
+        self.buttonGroup.setExclusive(False)
         self.buttons = []
-        labels = ['O', 'D', 'B', 'OB']
-        label_colors = ['LightCoral', 'Chartreuse', 'Aquamarine', 'CadetBlue']
-        for i in range(0, 4):
-            button = QtGui.QRadioButton(labels[i])
-            button.setStyleSheet('QRadioButton:checked { background-color: %s }'
-                                 % label_colors[i])
+        for i, (name, fullName, color) in enumerate(schema):
+            button = QtGui.QCheckBox(name)
+            button.setToolTip(fullName)
+            button.setStyleSheet('QCheckBox:checked { background-color: %s }'
+                                 % color)
             button.setCheckable(False)
             self.buttons.append(button)
             self.buttonLayout.addWidget(button)
-            self.buttonGroup.addButton(button, i + 1)
+            self.buttonGroup.addButton(button, 1 << i)
         self.buttonGroup.buttonClicked.connect(self.attrSelected)
 
         # Tight all widgets together
@@ -476,39 +1246,44 @@ class AnnotatorWidget(QtGui.QWidget):
         self.imageWidget.setImage(imagePath, bbox)
 
     def setAttr(self, attr):
-        if attr != 0:
-            self.buttons[attr - 1].setChecked(True)
-        else:
-            # Clean attribution button state
-            self.buttonGroup.setExclusive(False)
-            for button in self.buttons:
-                button.setChecked(False)
-            self.buttonGroup.setExclusive(True)
+        '''
+        Check the buttons of the attribute bits set in `attr`.
+        '''
+        for button in self.buttons:
+            button.setChecked(bool(attr & self.buttonGroup.id(button)))
 
     def initAttrButton(self):
         '''
         Set attribution button checkable, and clean attribution button state
         '''
-        self.buttonGroup.setExclusive(False)
         for button in self.buttons:
             button.setCheckable(True)
             button.setChecked(False)
             # Disable key event handler for this button
             button.keyPressEvent = lambda x: x.ignore()
-        self.buttonGroup.setExclusive(True)
 
     def attrSelected(self):
         '''
-        When some radio button is checked, change the attribution of the
+        When some attribute button is toggled, change the attribution of the
         corresponding frame.
 
         '''
         if self.labels is not None:
-            self.labels[self.frameID] = self.buttonGroup.checkedId()
+            attr = 0
+            for button in self.buttons:
+                if button.isChecked():
+                    attr |= self.buttonGroup.id(button)
+            self.labels[self.frameID] = attr
+            self.labelChanged.emit(self.frameID, attr)
 
 if __name__ == '__main__':
     app = QtGui.QApplication(sys.argv)
+    frameCache.setBudget(frameCacheMB)
     dataRoot = './data'
     window = MyApp(dataRoot)
     window.show()
+    importreport.mark('window shown')
+    window.loader.preload(heavyModules)
+    # Runs once the window has been painted
+    QtCore.QTimer.singleShot(0, importreport.report)
     sys.exit(app.exec_())
@@ -0,0 +1,304 @@
+# coding: utf-8
+# python2
+
+'''
+Sequences read directly from zip and tar archives.
+
+A sequence of data/imageFiles can be a `<seq>.zip` or an uncompressed
+`<seq>.tar` instead of a directory. The archive is used as if it was
+extracted: the frame `0001.jpg` of `Basketball.zip` has the path
+data/imageFiles/Basketball.zip/Basketball/img/0001.jpg (or
+Basketball.zip/img/0001.jpg when the archive has no top directory).
+
+Every archive has an index of its members with the offset of their data,
+kept in data/cache/archives/<archive>.idx and rebuilt when the archive
+changes. The archive is memory-mapped, reading a member is a slice of the
+mapping (inflated for deflated zip members), nothing is extracted.
+
+Build the indexes of all archives ahead of time with:
+
+    python archives.py [--data ./data]
+'''
+
+from __future__ import print_function
+import os
+import os.path
+import re
+import sys
+import json
+import mmap
+import time
+import zlib
+import struct
+import argparse
+import tarfile
+import zipfile
+import threading
+from fileutil import writeAtomic
+
+archiveExt = ['.zip', '.tar']
+
+# An archive used as a directory somewhere in a path
+archivePattern = re.compile(r'\.(zip|tar)(?=[/\\]|$)')
+
+# Directory of the persistent member indexes, see setIndexRoot
+indexRoot = None
+indexVersion = 1
+
+# Zip local file header, the member data follows its name and extra field
+zipLocalHeader = struct.Struct('<4s2B4HL2L2H')
+
+# archive path -> ArchiveIndex, or None if the archive is missing or broken
+archives = {}
+archivesLock = threading.Lock()
+
+
+def setIndexRoot(path):
+    global indexRoot
+    indexRoot = path
+
+
+def zipMembers(path):
+    '''
+    Return {member: [data offset, stored size, size, mtime, method]} of the
+    stored and deflated files of a zip archive.
+    '''
+    members = {}
+    with open(path, 'rb') as f:
+        for info in zipfile.ZipFile(f).infolist():
+            if info.filename.endswith('/') or \
+                    info.compress_type not in (zipfile.ZIP_STORED,
+                                               zipfile.ZIP_DEFLATED):
+                continue
+            f.seek(info.header_offset)
+            header = zipLocalHeader.unpack(f.read(zipLocalHeader.size))
+            offset = info.header_offset + zipLocalHeader.size + \
+                header[10] + header[11]
+            mtime = time.mktime(info.date_time + (0, 0, -1))
+            members[info.filename] = [offset, info.compress_size,
+                                      info.file_size, mtime,
+                                      info.compress_type]
+    return members
+
+
+def tarMembers(path):
+    '''
+    Return {member: [data offset, stored size, size, mtime, method]} of the
+    files of an uncompressed tar archive. Only the headers are read.
+    '''
+    members = {}
+    with tarfile.open(path, 'r:') as tar:
+        for info in tar:
+            if not info.isfile():
+                continue
+            name = info.name[2:] if info.name.startswith('./') else info.name
+            members[name] = [info.offset_data, info.size, info.size,
+                             float(info.mtime), zipfile.ZIP_STORED]
+    return members
+
+
+class ArchiveIndex(object):
+    '''
+    Read-only, memory-mapped archive with the offsets of its members.
+    Members are read like the frames of a FramePack (see framepack.py).
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        st = os.stat(path)
+        self.mtime = st.st_mtime
+        self.members = self.readIndex(st)
+        if self.members is None:
+            if path.endswith('.zip'):
+                self.members = zipMembers(path)
+            else:
+                self.members = tarMembers(path)
+            self.saveIndex(st)
+        # directory -> names of its files, '' is the archive root
+        self.dirs = {}
+        for member in self.members:
+            parent, name = member.rpartition('/')[::2]
+            self.dirs.setdefault(parent, []).append(name)
+            while parent:
+                parent, name = parent.rpartition('/')[::2]
+                self.dirs.setdefault(parent, [])
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def indexFile(self):
+        if indexRoot is None:
+            return None
+        return os.path.join(indexRoot, os.path.basename(self.path) + '.idx')
+
+    def readIndex(self, st):
+        '''
+        Return the members saved in the index file, or None if it is missing
+        or stale.
+        '''
+        indexFile = self.indexFile()
+        if indexFile is None:
+            return None
+        try:
+            with open(indexFile, 'rb') as f:
+                index = json.loads(zlib.decompress(f.read()))
+            if index['version'] == indexVersion and \
+                    index['archive'] == os.path.abspath(self.path) and \
+                    index['mtime'] == st.st_mtime and \
+                    index['size'] == st.st_size:
+                return index['members']
+        except (IOError, ValueError, KeyError, zlib.error):
+            pass
+        return None
+
+    def saveIndex(self, st):
+        indexFile = self.indexFile()
+        if indexFile is None:
+            return
+        if not os.path.isdir(indexRoot):
+            os.makedirs(indexRoot)
+        index = {'version': indexVersion,
+                 'archive': os.path.abspath(self.path),
+                 'mtime': st.st_mtime, 'size': st.st_size,
+                 'members': self.members}
+        writeAtomic(indexFile, lambda f: f.write(zlib.compress(json.dumps(
+            index, separators=(',', ':')).encode('utf-8'))), durable=False)
+
+    def __contains__(self, member):
+        return member in self.members
+
+    def isDir(self, member):
+        return member in self.dirs
+
+    def listDir(self, member):
+        return list(self.dirs.get(member, []))
+
+    def read(self, member):
+        '''
+        Return the content of a member.
+        '''
+        offset, stored, _, _, method = self.members[member]
+        data = self.map[offset:offset + stored]
+        if method == zipfile.ZIP_DEFLATED:
+            data = zlib.decompress(data, -15)
+        return data
+
+    def frameSize(self, member):
+        return self.members[member][2]
+
+    def frameMtime(self, member):
+        return self.members[member][3]
+
+    def close(self):
+        self.map.close()
+
+
+def openArchive(path, mtime=None):
+    '''
+    Return the ArchiveIndex at `path`, or None if there is no valid archive.
+    Opened archives are kept, they are reopened only when `mtime` is given
+    and differs from the mtime of the opened archive.
+    '''
+    path = os.path.normpath(os.path.abspath(path))
+    with archivesLock:
+        if path in archives:
+            archive = archives[path]
+            current = archive.mtime if archive is not None else None
+            if mtime is None or mtime == current:
+                return archive
+        try:
+            archive = ArchiveIndex(path)
+        except (IOError, OSError, ValueError, EOFError, struct.error,
+                zipfile.BadZipfile, tarfile.TarError):
+            archive = None
+        archives[path] = archive
+        return archive
+
+
+def splitArchivePath(path):
+    '''
+    Return (archive path, member) of a path inside an archive, or None.
+    Only the path is parsed, nothing is opened.
+    '''
+    match = archivePattern.search(path)
+    if match is None:
+        return None
+    member = path[match.end() + 1:].replace(os.sep, '/').strip('/')
+    return path[:match.end()], member
+
+
+def locate(path):
+    '''
+    Return (archive, member) of a file read from an archive, or None.
+    '''
+    archived = splitArchivePath(path)
+    if archived is None:
+        return None
+    archive = openArchive(archived[0])
+    if archive is None or archived[1] not in archive:
+        return None
+    return archive, archived[1]
+
+
+def locateDir(path):
+    '''
+    Return (archive, member) of a directory inside an archive, or None.
+    '''
+    archived = splitArchivePath(path)
+    if archived is None:
+        return None
+    archive = openArchive(archived[0])
+    if archive is None or not archive.isDir(archived[1]):
+        return None
+    return archive, archived[1]
+
+
+def readBytes(path):
+    '''
+    Return the content of a file, which may be inside an archive.
+    '''
+    located = locate(path)
+    if located is not None:
+        return located[0].read(located[1])
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def seqArchive(datasetRoot, seq):
+    '''
+    Return the path used as the directory of a sequence stored as an archive,
+    or None.
+    '''
+    for ext in archiveExt:
+        archivePath = os.path.join(datasetRoot, seq + ext)
+        try:
+            mtime = os.path.getmtime(archivePath)
+        except OSError:
+            continue
+        # Reopen the archive if it has been replaced
+        archive = openArchive(archivePath, mtime)
+        if archive is None:
+            continue
+        if archive.isDir(seq):
+            # The archive has the sequence directory at its top
+            return os.path.join(archivePath, seq)
+        return archivePath
+    return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Build the member indexes of the dataset archives.')
+    parser.add_argument('--data', default='./data',
+                        help='data root containing imageFiles')
+    args = parser.parse_args()
+    setIndexRoot(os.path.join(args.data, 'cache', 'archives'))
+    imageRoot = os.path.join(args.data, 'imageFiles')
+    for fn in sorted(os.listdir(imageRoot)):
+        if os.path.splitext(fn)[1] not in archiveExt:
+            continue
+        archive = openArchive(os.path.join(imageRoot, fn))
+        if archive is None:
+            print('%s: not a readable archive' % fn)
+        else:
+            print('%s: %d members' % (fn, len(archive.members)))
+    sys.exit(0)
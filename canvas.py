@@ -0,0 +1,278 @@
+# coding: utf-8
+# python2
+
+'''
+Single-canvas page view.
+
+The whole page (frames, ground-truth boxes and attribute badges of every
+tile) is painted by one widget, so a page turn is a single repaint instead of
+one per image label and per button, and the grid can have any size. Clicks
+are hit-tested against the tile geometry, which is plain arithmetic.
+'''
+
+from __future__ import print_function
+from PyQt4 import QtCore, QtGui
+from PyQt4.QtCore import Qt
+from framecache import frameCache
+from labels import defaultSchema
+
+
+class Tile(object):
+    '''
+    A frame shown on the canvas, with its pixmap scaled for display.
+    '''
+
+    __slots__ = ('frameIdx', 'imagePath', 'bbox', 'frame', 'pixmap',
+                 'scaledKey', 'scaledPix', 'scaledSmooth')
+
+    def __init__(self, frameIdx, imagePath, bbox, frame, pixmap):
+        self.frameIdx = frameIdx
+        self.imagePath = imagePath
+        self.bbox = bbox
+        self.frame = frame
+        self.pixmap = pixmap
+        self.scaledKey = None
+        self.scaledPix = None
+        self.scaledSmooth = False
+
+
+class PageCanvas(QtGui.QWidget):
+    '''
+    A page of rows x cols tiles. Every tile is a frame with its ground-truth
+    box, above one badge per attribute of the schema; clicking a badge
+    toggles the attribute of the frame, clicking the frame opens it.
+    '''
+
+    # frame index, new attribution
+    labelChanged = QtCore.pyqtSignal(int, int)
+    # frame index
+    frameClicked = QtCore.pyqtSignal(int)
+
+    # Space between tiles and height of the badge row, in pixels
+    spacing = 6
+    badgeHeight = 22
+
+    # Delay (ms) after the last resize event before the smooth rescale
+    smoothDelay = 150
+
+    def __init__(self, rows=3, cols=3, schema=defaultSchema, parent=None):
+        super(PageCanvas, self).__init__(parent)
+        self.schema = schema
+        self.colors = [QtGui.QColor(color) for _, _, color in schema]
+        self.labels = None
+        # [first, last] frames of the marked range, or None
+        self.marked = None
+        self.tiles = []
+        self.rows = rows
+        self.cols = cols
+        self.resizing = False
+        self.smoothTimer = QtCore.QTimer(self)
+        self.smoothTimer.setSingleShot(True)
+        self.smoothTimer.setInterval(self.smoothDelay)
+        self.smoothTimer.timeout.connect(self.resizeFinished)
+        # Keys are handled by the main window
+        self.setFocusPolicy(Qt.NoFocus)
+        self.setSizePolicy(QtGui.QSizePolicy.Expanding,
+                           QtGui.QSizePolicy.Expanding)
+
+    def setGrid(self, rows, cols):
+        self.rows = rows
+        self.cols = cols
+        self.update()
+
+    def setLabels(self, labels):
+        '''
+        Let the badges show and change the attribution list of a sequence,
+        None disables them.
+        '''
+        self.labels = labels
+        self.update()
+
+    def setMarked(self, first, last):
+        '''
+        Outline the tiles of the frames [first, last], None removes it.
+        '''
+        self.marked = None if first is None else (first, last)
+        self.update()
+
+    def tileRect(self, i):
+        row, col = divmod(i, self.cols)
+        w = self.width() / float(self.cols)
+        h = self.height() / float(self.rows)
+        half = self.spacing / 2
+        return QtCore.QRect(int(col * w) + half, int(row * h) + half,
+                            int(w) - self.spacing, int(h) - self.spacing)
+
+    def imageRect(self, i):
+        return self.tileRect(i).adjusted(0, 0, 0, -self.badgeHeight)
+
+    def badgeRect(self, i, k):
+        rect = self.tileRect(i)
+        w = rect.width() / float(len(self.schema))
+        return QtCore.QRect(rect.left() + int(k * w),
+                            rect.bottom() - self.badgeHeight + 2,
+                            int(w), self.badgeHeight - 2)
+
+    def tileSize(self):
+        '''
+        Return the size a frame is displayed at, frames are decoded for it.
+        '''
+        return self.imageRect(0).size()
+
+    def hitTest(self, pos):
+        '''
+        Return (tile index, badge index or None) under pos, or None.
+        '''
+        if self.width() <= 0 or self.height() <= 0:
+            return None
+        col = int(pos.x() * self.cols / self.width())
+        row = int(pos.y() * self.rows / self.height())
+        # Positions outside the canvas (e.g. above it, on the menu bar) must
+        # not wrap to a tile of the last row
+        if not self.rect().contains(pos) or not 0 <= col < self.cols or \
+                not 0 <= row < self.rows:
+            return None
+        i = row * self.cols + col
+        if i >= len(self.tiles):
+            return None
+        if self.imageRect(i).contains(pos):
+            return i, None
+        for k in range(len(self.schema)):
+            if self.badgeRect(i, k).contains(pos):
+                return i, k
+        return None
+
+    def setPage(self, frames):
+        '''
+        Show [(frame index, image path, ground-truth box)], at most one page.
+        Frames are read from the frame cache at the tile resolution, tiles
+        whose frame did not change keep their pixmap.
+        '''
+        size = self.tileSize()
+        previous = dict((tile.imagePath, tile) for tile in self.tiles)
+        tiles = []
+        for frameIdx, imagePath, bbox in frames:
+            # Prefetched frames are already in the cache, others are decoded
+            frame = frameCache.load(imagePath, size)
+            tile = previous.get(imagePath)
+            if tile is not None and tile.frame is frame:
+                tile.frameIdx = frameIdx
+                tile.bbox = bbox
+            else:
+                tile = Tile(frameIdx, imagePath, bbox, frame,
+                            QtGui.QPixmap.fromImage(frame.image))
+            tiles.append(tile)
+        self.tiles = tiles
+        self.update()
+
+    def clear(self):
+        self.tiles = []
+        self.update()
+
+    def scaledPixmap(self, tile, size):
+        '''
+        Return the pixmap of a tile scaled to `size`, reuse the last result
+        if possible.
+        '''
+        key = (size.width(), size.height())
+        if key == tile.scaledKey and (tile.scaledSmooth or self.resizing):
+            return tile.scaledPix
+        if self.resizing:
+            mode = Qt.FastTransformation
+        else:
+            mode = Qt.SmoothTransformation
+        tile.scaledPix = tile.pixmap.scaled(size, Qt.KeepAspectRatio,
+                                            transformMode=mode)
+        tile.scaledKey = key
+        tile.scaledSmooth = not self.resizing
+        return tile.scaledPix
+
+    def resizeEvent(self, event):
+        super(PageCanvas, self).resizeEvent(event)
+        self.resizing = True
+        self.smoothTimer.start()
+
+    def resizeFinished(self):
+        self.resizing = False
+        # Bigger tiles may need a finer decode of the frames
+        self.setPage([(tile.frameIdx, tile.imagePath, tile.bbox)
+                      for tile in self.tiles])
+
+    def paintEvent(self, event):
+        painter = QtGui.QPainter(self)
+        if not self.tiles:
+            painter.drawText(self.rect(), Qt.AlignCenter,
+                             'No sequence selected')
+            return
+        for i, tile in enumerate(self.tiles):
+            if self.tileRect(i).intersects(event.rect()):
+                self.paintTile(painter, i, tile)
+
+    def paintTile(self, painter, i, tile):
+        rect = self.imageRect(i)
+        painter.setBrush(Qt.NoBrush)
+        if self.marked is not None and \
+                self.marked[0] <= tile.frameIdx <= self.marked[1]:
+            painter.setPen(QtGui.QPen(
+                self.palette().color(QtGui.QPalette.Highlight), 3))
+            painter.drawRect(self.tileRect(i).adjusted(-2, -2, 1, 1))
+        painter.setPen(self.palette().color(QtGui.QPalette.Mid))
+        painter.drawRect(rect.adjusted(0, 0, -1, -1))
+        if not tile.frame.isNull():
+            scaledPix = self.scaledPixmap(tile, rect.size())
+            x = rect.left() + (rect.width() - scaledPix.width()) / 2
+            y = rect.top() + (rect.height() - scaledPix.height()) / 2
+            painter.drawPixmap(x, y, scaledPix)
+            bbox = tile.bbox
+            # Frames without ground-truth have a NaN box
+            if bbox is not None and all(v == v for v in bbox):
+                # The box is given in full resolution coordinates
+                fullWidth = tile.frame.fullSize.width()
+                scale = scaledPix.width() / float(fullWidth or 1)
+                painter.setPen(QtGui.QPen(QtGui.QColor('red'), 2))
+                painter.drawRect(QtCore.QRectF(
+                    x + bbox[0] * scale, y + bbox[1] * scale,
+                    bbox[2] * scale, bbox[3] * scale))
+
+        flags = self.labels[tile.frameIdx] if self.labels is not None else 0
+        for k, (name, _, _) in enumerate(self.schema):
+            badge = self.badgeRect(i, k).adjusted(1, 0, -1, 0)
+            if flags & (1 << k):
+                painter.setBrush(self.colors[k])
+            else:
+                painter.setBrush(Qt.NoBrush)
+            if self.labels is None:
+                painter.setPen(self.palette().color(QtGui.QPalette.Mid))
+            else:
+                painter.setPen(self.palette().color(QtGui.QPalette.Text))
+            painter.drawRect(badge)
+            painter.drawText(badge, Qt.AlignCenter, name)
+
+    def mouseReleaseEvent(self, event):
+        if event.button() != Qt.LeftButton:
+            return
+        hit = self.hitTest(event.pos())
+        if hit is None:
+            return
+        i, k = hit
+        tile = self.tiles[i]
+        if k is None:
+            self.frameClicked.emit(tile.frameIdx)
+        elif self.labels is not None:
+            attr = self.labels[tile.frameIdx] ^ (1 << k)
+            self.labels[tile.frameIdx] = attr
+            self.labelChanged.emit(tile.frameIdx, attr)
+            # Only this tile changed
+            self.update(self.tileRect(i))
+
+    def event(self, event):
+        if event.type() == QtCore.QEvent.ToolTip:
+            hit = self.hitTest(event.pos())
+            if hit is not None and hit[1] is not None:
+                QtGui.QToolTip.showText(event.globalPos(),
+                                        self.schema[hit[1]][1])
+            else:
+                QtGui.QToolTip.hideText()
+                event.ignore()
+            return True
+        return super(PageCanvas, self).event(event)
@@ -0,0 +1,308 @@
+# coding: utf-8
+# python2
+
+'''
+Dataset index manifest.
+
+Listing the image directory, sorting the frames and parsing the ground-truth
+of a sequence is slow on network filesystems, so it is done once and kept in
+data/cache/manifest.bin (a zlib compressed pickle), the ground-truth of every
+sequence is kept as a (N, 4) array in data/cache/gt/<seq>.npy and memory-mapped
+when the sequence is opened again. An entry is rebuilt only
+when the mtime of the sequence image directory or of its ground-truth file
+changes, or when its frame range changed. The sequence list is refreshed only
+when the mtime of the dataset root changes.
+
+Build the whole manifest ahead of time with:
+
+    python dataset.py [--data ./data]
+'''
+
+from __future__ import print_function
+import os
+import os.path
+import sys
+import string
+import zlib
+import argparse
+import threading
+import cPickle as pickle
+import numpy as np
+from fileutil import writeAtomic
+from framepack import packName, openPack, isPackPath
+from archives import archiveExt, setIndexRoot, splitArchivePath, \
+    openArchive, locateDir, readBytes, seqArchive
+
+validExt = ['jpg', 'JPG', 'jpeg', 'JPEG', 'png', 'PNG']
+
+# Some sequence has 2 ground-truth file
+specialSeq = ['Skating2', 'Jogging']
+
+# Directories of the dataset root which are not sequences
+ignoredSeq = ['anno', 'MEEM']
+
+# Bump when the layout of an entry changes
+manifestVersion = 2
+
+# Ground-truth values may be separated by commas, tabs or spaces
+gtDelimiters = string.maketrans(',\t;', '   ')
+
+
+def readFrameRange(frameRangeFile):
+    '''
+    Every line format is [frame_name, start_frame, end_frame]
+    '''
+    frameRange = {}
+    with open(frameRangeFile) as f:
+        for l in f:
+            raw = l.split(' ')
+            if len(raw) < 3:
+                continue
+            frameRange[raw[0]] = [int(raw[1]), int(raw[2])]
+    return frameRange
+
+
+def loadGroundTruth(gtPath):
+    '''
+    Parse a ground-truth file into a (N, 4) float array of [x, y, w, h].
+    The whole file is parsed at once, floats and negative values are kept.
+    '''
+    text = readBytes(gtPath).translate(gtDelimiters)
+    values = np.fromstring(text, dtype=np.float64, sep=' ')
+    # Ignore an incomplete last line
+    return values[:len(values) // 4 * 4].reshape(-1, 4)
+
+
+def mtimeOf(path):
+    '''
+    Return the mtime of a file, or of the archive containing it, or None.
+    '''
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        pass
+    archived = splitArchivePath(path)
+    if archived is not None:
+        archive = openArchive(archived[0])
+        if archive is not None and (archived[1] in archive or
+                                    archive.isDir(archived[1])):
+            return archive.mtime
+    return None
+
+
+class DatasetManifest(object):
+    '''
+    Frame names, frame range, ground-truth and file stats of every sequence.
+    '''
+
+    def __init__(self, datasetRoot, frameRange, manifestFile):
+        self.datasetRoot = datasetRoot
+        self.frameRange = frameRange
+        self.manifestFile = manifestFile
+        self.gtRoot = os.path.join(os.path.dirname(manifestFile), 'gt')
+        setIndexRoot(os.path.join(os.path.dirname(manifestFile), 'archives'))
+        self.lock = threading.Lock()
+        self.data = self.read()
+
+    def read(self):
+        try:
+            with open(self.manifestFile, 'rb') as f:
+                data = pickle.loads(zlib.decompress(f.read()))
+            if data.get('version') == manifestVersion:
+                return data
+        except (IOError, EOFError, zlib.error, pickle.UnpicklingError,
+                AttributeError, ValueError):
+            pass
+        return {'version': manifestVersion, 'rootMtime': None,
+                'seqNames': [], 'entries': {}}
+
+    def save(self):
+        '''
+        Write the manifest atomically.
+        The lock must be held by the caller.
+        '''
+        manifestDir = os.path.dirname(self.manifestFile)
+        if manifestDir and not os.path.isdir(manifestDir):
+            os.makedirs(manifestDir)
+        writeAtomic(self.manifestFile, lambda f: f.write(zlib.compress(
+            pickle.dumps(self.data, pickle.HIGHEST_PROTOCOL))),
+            durable=False)
+
+    def seqNames(self):
+        '''
+        Return the sorted sequence names, special sequences are split in two.
+        '''
+        with self.lock:
+            rootMtime = mtimeOf(self.datasetRoot)
+            if rootMtime != self.data['rootMtime']:
+                self.data['seqNames'] = self.listSeqs()
+                self.data['rootMtime'] = rootMtime
+                self.save()
+            return list(self.data['seqNames'])
+
+    def listSeqs(self):
+        seqNames = set()
+        for fn in os.listdir(self.datasetRoot):
+            seq, ext = os.path.splitext(fn)
+            # Archived sequences are listed without their extension
+            if ext not in archiveExt:
+                seq = fn
+            if seq not in ignoredSeq:
+                seqNames.add(seq)
+        seqNames = list(seqNames)
+        for seq in specialSeq:
+            if seq in seqNames:
+                seqNames.remove(seq)
+                for i in range(1, 3):
+                    seqNames.append('%s-%d' % (seq, i))
+        return sorted(seqNames)
+
+    def paths(self, seq):
+        '''
+        Return (image directory, ground-truth file) of a sequence.
+        '''
+        probe = seq.split('-')
+        if len(probe) == 2:
+            # Special sequences share the image directory
+            seqName = probe[0]
+            gtFile = 'groundtruth_rect.%s.txt' % probe[1]
+        else:
+            seqName = seq
+            gtFile = 'groundtruth_rect.txt'
+        seqDir = os.path.join(self.datasetRoot, seqName)
+        if not os.path.isdir(seqDir):
+            # The sequence may be stored as an archive
+            seqDir = seqArchive(self.datasetRoot, seqName) or seqDir
+        return os.path.join(seqDir, 'img'), os.path.join(seqDir, gtFile)
+
+    def entry(self, seq, save=True):
+        '''
+        Return the manifest entry of a sequence, rebuild it if it is stale.
+        Only the image directory (or its pack) and the ground-truth file are
+        stat. A packed sequence is read from its pack, see framepack.py.
+        '''
+        imgDir, gtPath = self.paths(seq)
+        packPath = os.path.join(os.path.dirname(imgDir), packName)
+        packMtime = mtimeOf(packPath)
+        if packMtime is not None and \
+                openPack(packPath, packMtime) is not None:
+            imgDir, dirMtime = packPath, packMtime
+        else:
+            dirMtime = mtimeOf(imgDir)
+        gtMtime = mtimeOf(gtPath)
+        with self.lock:
+            entry = self.data['entries'].get(seq)
+            if entry is None or entry['imgDir'] != imgDir or \
+                    entry['dirMtime'] != dirMtime or \
+                    entry['gtMtime'] != gtMtime or \
+                    entry['frameRange'] != self.frameRange[seq]:
+                entry = self.buildEntry(seq, imgDir, gtPath)
+                entry['dirMtime'] = dirMtime
+                entry['gtMtime'] = gtMtime
+                self.data['entries'][seq] = entry
+                if save:
+                    self.save()
+            return entry
+
+    def buildEntry(self, seq, imgDir, gtPath):
+        # Get current sequence's frame range
+        frs, fre = self.frameRange[seq]
+
+        # Get current sequence's frame names (need filter some files)
+        pack = openPack(imgDir) if isPackPath(imgDir) else None
+        archived = locateDir(imgDir) if pack is None else None
+        if pack is not None:
+            allNames = pack.names
+        elif archived is not None:
+            archive, member = archived
+            allNames = archive.listDir(member)
+        else:
+            allNames = os.listdir(imgDir)
+        imgNames = [fn for fn in allNames if any(
+            fn.endswith(ext) for ext in validExt)]
+        imgNames = sorted(imgNames)
+        firstFrame = int(imgNames[0].split('.')[0])
+        frs -= firstFrame
+        fre -= firstFrame
+        imgNames = imgNames[frs:fre]
+        if pack is not None:
+            sizes = [pack.frameSize(fn) for fn in imgNames]
+            mtimes = [pack.frameMtime(fn) for fn in imgNames]
+        elif archived is not None:
+            members = [member + '/' + fn for fn in imgNames]
+            sizes = [archive.frameSize(m) for m in members]
+            mtimes = [archive.frameMtime(m) for m in members]
+        else:
+            stats = [os.stat(os.path.join(imgDir, fn)) for fn in imgNames]
+            sizes = [st.st_size for st in stats]
+            mtimes = [st.st_mtime for st in stats]
+
+        # Read ground-truth of this sequence, and keep it as .npy
+        gtCache = os.path.join(self.gtRoot, seq + '.npy')
+        self.cacheGroundTruth(seq, gtPath, gtCache, frs, fre)
+
+        return {'imgDir': imgDir,
+                'imgNames': imgNames,
+                'firstFrame': firstFrame,
+                'frameRange': list(self.frameRange[seq]),
+                'gtPath': gtPath,
+                'gtCache': gtCache,
+                'gtSlice': (frs, fre),
+                'sizes': np.array(sizes, np.int64),
+                'mtimes': np.array(mtimes, np.float64)}
+
+    def cacheGroundTruth(self, seq, gtPath, gtCache, frs, fre):
+        # origin gt format is [x, y, w, h]
+        gts = loadGroundTruth(gtPath)
+        gtrs, gtre = frs, fre
+        if seq == 'David':
+            # Sequence 'David' is very special!
+            gtrs -= 299
+            gtre -= 299
+        gts = gts[gtrs:gtre]
+        if not os.path.isdir(self.gtRoot):
+            os.makedirs(self.gtRoot)
+        writeAtomic(gtCache, lambda f: np.save(f, gts), durable=False)
+        return gts
+
+    def groundTruth(self, seq, entry=None):
+        '''
+        Return the (N, 4) ground-truth array of a sequence, memory-mapped
+        from its .npy cache.
+        '''
+        if entry is None:
+            entry = self.entry(seq)
+        try:
+            return np.load(entry['gtCache'], mmap_mode='r')
+        except (IOError, ValueError):
+            # The cache file is missing or broken, parse the text again
+            frs, fre = entry['gtSlice']
+            return self.cacheGroundTruth(seq, entry['gtPath'],
+                                         entry['gtCache'], frs, fre)
+
+    def build(self, log=True):
+        '''
+        Build or refresh the entries of all sequences.
+        '''
+        for seq in self.seqNames():
+            if seq not in self.frameRange:
+                continue
+            entry = self.entry(seq, save=False)
+            if log:
+                print('%s: %d frames' % (seq, len(entry['imgNames'])))
+        with self.lock:
+            self.save()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Build the dataset manifest used by the annotator.')
+    parser.add_argument('--data', default='./data',
+                        help='data root containing imageFiles')
+    args = parser.parse_args()
+    manifest = DatasetManifest(
+        os.path.join(args.data, 'imageFiles'),
+        readFrameRange(os.path.join(args.data, 'frameRange.txt')),
+        os.path.join(args.data, 'cache', 'manifest.bin'))
+    manifest.build()
+    sys.exit(0)
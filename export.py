@@ -0,0 +1,210 @@
+# coding: utf-8
+# python2
+
+'''
+Dataset-wide consolidated annotation export.
+
+All annotated sequences are written into a single file, with a flat array of
+labels, a flat array of ground-truths, per-sequence offsets and a table of
+frame paths (relative to imageFiles). Each array is stored raw and aligned,
+so consumers can memory-map the file and slice any sequence without a copy:
+
+    export = AnnotationExport('data/annotations.odbx')
+    seq = export.sequence('Basketball')
+    seq['labels'], seq['gts'], seq['paths']
+
+Export (or update) with:
+
+    python export.py [--data ./data] [--out ./data/annotations.odbx]
+
+The export is incremental: sequences whose mat file, journal, frame list and
+ground-truth did not change are copied from the previous export.
+'''
+
+from __future__ import print_function
+import os
+import os.path
+import sys
+import json
+import struct
+import argparse
+import numpy as np
+from fileutil import writeAtomic
+from dataset import DatasetManifest, readFrameRange, mtimeOf
+from labels import readLabels, defaultSchema
+from journal import LabelJournal
+
+magic = 'ODBX'
+exportVersion = 1
+# magic, version, header length
+preamble = struct.Struct('<4sIQ')
+alignment = 64
+
+
+def align(offset):
+    return -(-offset // alignment) * alignment
+
+
+class AnnotationExport(object):
+    '''
+    Read-only, memory-mapped view of a consolidated export.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            tag, version, headerLen = preamble.unpack(f.read(preamble.size))
+            if tag != magic or version != exportVersion:
+                raise ValueError('%s is not an annotation export' % path)
+            self.header = json.loads(f.read(headerLen).decode('utf-8'))
+        self.arrays = {}
+        for name, desc in self.header['arrays'].items():
+            shape = tuple(desc['shape'])
+            if shape[0] == 0:
+                self.arrays[name] = np.zeros(shape, desc['dtype'])
+            else:
+                self.arrays[name] = np.memmap(path, desc['dtype'], 'r',
+                                              desc['offset'], shape)
+        self.seqNames = self.header['seqs']
+        self.seqIndex = dict((seq, i) for i, seq in enumerate(self.seqNames))
+
+    def __contains__(self, seq):
+        return seq in self.seqIndex
+
+    def sequence(self, seq):
+        '''
+        Return the labels, legacy codes, ground-truths and frame paths of a
+        sequence as views of the mapped file.
+        '''
+        i = self.seqIndex[seq]
+        start, end = self.arrays['offsets'][i:i + 2]
+        return dict((name, self.arrays[name][start:end])
+                    for name in ['labels', 'codes', 'gts', 'paths'])
+
+    def fingerprint(self, seq):
+        return self.header['sources'].get(seq)
+
+
+def writeExport(path, seqData):
+    '''
+    Write [(seq, fingerprint, {labels, codes, gts, paths})] into one file.
+    '''
+    lengths = [len(data['labels']) for _, _, data in seqData]
+    offsets = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+
+    def concat(name, dtype, shape):
+        parts = [np.asarray(data[name], dtype) for _, _, data in seqData]
+        if not parts:
+            return np.zeros(shape, dtype)
+        return np.concatenate(parts)
+
+    pathLen = max([1] + [len(p) for _, _, data in seqData
+                         for p in data['paths']])
+    arrays = [('labels', concat('labels', np.uint8, (0,))),
+              ('codes', concat('codes', np.uint8, (0,))),
+              ('gts', concat('gts', np.float64, (0, 4))),
+              ('paths', concat('paths', 'S%d' % pathLen, (0,))),
+              ('offsets', offsets)]
+
+    # Lay the arrays out after the header, every array aligned
+    header = {'seqs': [seq for seq, _, _ in seqData],
+              'sources': dict((seq, fp) for seq, fp, _ in seqData),
+              'schema': defaultSchema,
+              'arrays': {}}
+    # The header size depends on the offsets, reserve room for them
+    descs = dict((name, {'dtype': a.dtype.str, 'shape': list(a.shape),
+                         'offset': 0}) for name, a in arrays)
+    header['arrays'] = descs
+    headerLen = len(json.dumps(header)) + 32 * len(arrays)
+    offset = align(preamble.size + headerLen)
+    for name, a in arrays:
+        descs[name]['offset'] = offset
+        offset = align(offset + a.nbytes)
+    headerText = json.dumps(header).encode('utf-8')
+    headerText += ' ' * (headerLen - len(headerText))
+
+    def writer(f):
+        f.write(preamble.pack(magic, exportVersion, headerLen))
+        f.write(headerText)
+        for name, a in arrays:
+            f.seek(descs[name]['offset'])
+            f.write(np.ascontiguousarray(a).tostring())
+        f.truncate(offset)
+    writeAtomic(path, writer)
+
+
+def export(dataRoot, outPath, log=True):
+    '''
+    Export every annotated sequence, reuse unchanged ones from outPath.
+    '''
+    datasetRoot = os.path.join(dataRoot, 'imageFiles')
+    attrRoot = os.path.join(dataRoot, 'annotateFiles')
+    manifest = DatasetManifest(
+        datasetRoot, readFrameRange(os.path.join(dataRoot, 'frameRange.txt')),
+        os.path.join(dataRoot, 'cache', 'manifest.bin'))
+    try:
+        previous = AnnotationExport(outPath)
+    except (IOError, ValueError):
+        previous = None
+
+    seqData = []
+    reused = 0
+    for seq in manifest.seqNames():
+        seqAttrFile = os.path.join(attrRoot, seq)
+        if seq not in manifest.frameRange or \
+                mtimeOf(seqAttrFile + '.mat') is None:
+            # Not annotated yet
+            continue
+        entry = manifest.entry(seq)
+        fingerprint = [mtimeOf(seqAttrFile + '.mat'),
+                       mtimeOf(seqAttrFile + '.journal'),
+                       entry['dirMtime'], entry['gtMtime'],
+                       entry['frameRange']]
+        if previous is not None and seq in previous and \
+                previous.fingerprint(seq) == fingerprint:
+            # Copy out of the old mapping, the file is about to be replaced
+            data = dict((name, np.array(a))
+                        for name, a in previous.sequence(seq).items())
+            reused += 1
+        else:
+            seqLen = len(entry['imgNames'])
+            labels = readLabels(seqAttrFile, seqLen)
+            LabelJournal.replay(seqAttrFile, labels)
+            # Packed sequences are exported with their plain frame paths
+            relDir = os.path.relpath(manifest.paths(seq)[0], datasetRoot)
+            # Labels may run past the frames, only frames are exported
+            data = {'labels': labels.flags[:seqLen],
+                    'codes': labels.toLegacy()[0][:seqLen],
+                    'gts': np.asarray(manifest.groundTruth(seq, entry)),
+                    'paths': [os.path.join(relDir, fn).replace(os.sep, '/')
+                              for fn in entry['imgNames']]}
+            # Ground-truth files may be shorter than the frame list
+            gts = np.full((seqLen, 4), np.nan)
+            n = min(seqLen, len(data['gts']))
+            gts[:n] = data['gts'][:n]
+            data['gts'] = gts
+        seqData.append((seq, fingerprint, data))
+        if log:
+            print('%s: %d frames' % (seq, len(data['labels'])))
+    previous = None
+
+    outDir = os.path.dirname(outPath)
+    if outDir and not os.path.isdir(outDir):
+        os.makedirs(outDir)
+    writeExport(outPath, seqData)
+    if log:
+        print('Exported %d sequences (%d unchanged) to %s' %
+              (len(seqData), reused, outPath))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Export all annotations into one memory-mappable file.')
+    parser.add_argument('--data', default='./data',
+                        help='data root containing imageFiles and annotateFiles')
+    parser.add_argument('--out', default=None,
+                        help='export file (default: <data>/annotations.odbx)')
+    args = parser.parse_args()
+    outPath = args.out or os.path.join(args.data, 'annotations.odbx')
+    export(args.data, outPath)
+    sys.exit(0)
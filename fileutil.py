@@ -0,0 +1,41 @@
+# coding: utf-8
+# python2
+
+from __future__ import print_function
+import os
+
+
+def fsyncDir(path):
+    '''
+    Flush the entries of a directory (created, renamed or removed files) to
+    disk. Directories can not be opened on Windows, where it is a no-op.
+    '''
+    if os.name == 'nt':
+        return
+    fd = os.open(path or '.', os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def writeAtomic(target, writer, mode='wb', durable=True):
+    '''
+    Call writer(f) on a temp file next to target, then move it in place, so
+    a crash while writing never leaves a truncated target.
+    With durable, the data and the rename are on disk when it returns, so a
+    power loss keeps either the old or the new target. Caches which can be
+    rebuilt skip the fsyncs.
+    '''
+    tmp = target + '.tmp'
+    with open(tmp, mode) as f:
+        writer(f)
+        if durable:
+            f.flush()
+            os.fsync(f.fileno())
+    if os.name == 'nt' and os.path.exists(target):
+        # os.rename does not replace an existing file on Windows
+        os.remove(target)
+    os.rename(tmp, target)
+    if durable:
+        fsyncDir(os.path.dirname(target))
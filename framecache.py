@@ -0,0 +1,315 @@
+# coding: utf-8
+# python2
+
+from __future__ import print_function
+import io
+import os.path
+import threading
+from collections import OrderedDict
+from PyQt4 import QtCore, QtGui
+from framepack import locate as locatePacked, plainPath
+from archives import locate as locateArchived
+
+# libjpeg can decode directly at 1/2, 1/4 and 1/8 of the full resolution
+reduceFactors = [8, 4, 2]
+
+
+def reduceFactor(fullSize, targetSize):
+    '''
+    Return the biggest DCT scale denominator for which the reduced image still
+    covers `targetSize` once fitted with KeepAspectRatio, or 1.
+    '''
+    if targetSize is None or fullSize.isEmpty() or targetSize.isEmpty():
+        return 1
+    fit = min(targetSize.width() / float(fullSize.width()),
+              targetSize.height() / float(fullSize.height()))
+    for factor in reduceFactors:
+        if factor * fit <= 1:
+            return factor
+    return 1
+
+
+def locateFrame(path):
+    '''
+    Return (container, name) of a frame read from a pack or an archive, or
+    None for a plain file.
+    '''
+    return locatePacked(path) or locateArchived(path)
+
+
+class Frame(object):
+    '''
+    A decoded frame, possibly at reduced resolution.
+    `fullSize` is the size of the original image, ground-truth boxes are given
+    in that coordinate system.
+    '''
+
+    __slots__ = ('image', 'fullSize', 'reduce')
+
+    def __init__(self, image, fullSize, reduce=1):
+        self.image = image
+        self.fullSize = fullSize
+        self.reduce = reduce
+
+    def isNull(self):
+        return self.image.isNull()
+
+    def byteCount(self):
+        return self.image.byteCount()
+
+    def scale(self):
+        '''
+        Ratio between the decoded and the original image width.
+        '''
+        if self.fullSize.isEmpty():
+            return 1.0
+        return self.image.width() / float(self.fullSize.width())
+
+
+def decodeFrame(path, targetSize=None):
+    '''
+    Decode the image at `path` into a Frame.
+
+    With a target size, JPEG files are decoded by PIL in draft mode, so
+    libjpeg only produces a DCT-scaled image close to the target instead of
+    the full resolution. Other formats are decoded and scaled down.
+    Frames of a packed or archived sequence are decoded from the mapping.
+    '''
+    packed = locateFrame(path)
+    data = packed[0].read(packed[1]) if packed is not None else None
+    path = plainPath(path)
+    if targetSize is None:
+        image = QtGui.QImage()
+        if data is not None:
+            image.loadFromData(data)
+        else:
+            image.load(path)
+        return Frame(image, image.size())
+    # PIL is imported on first use (see heavyModules in annotator.py)
+    from PIL import Image
+    from PIL.ImageQt import ImageQt
+    try:
+        img = Image.open(io.BytesIO(data) if data is not None else path)
+    except IOError:
+        return Frame(QtGui.QImage(), QtCore.QSize())
+    width, height = img.size
+    fullSize = QtCore.QSize(width, height)
+    factor = reduceFactor(fullSize, targetSize)
+    reducedSize = (-(-width // factor), -(-height // factor))
+    if factor > 1:
+        if img.format == 'JPEG':
+            img.draft('RGB', reducedSize)
+        else:
+            img = img.resize(reducedSize, Image.BILINEAR)
+    if img.mode not in ('RGB', 'RGBA'):
+        img = img.convert('RGB')
+    # ImageQt shares the PIL buffer, copy it to own the pixels
+    image = ImageQt(img).copy()
+    return Frame(image, fullSize, factor)
+
+
+class FrameCache(object):
+    '''
+    A process-wide LRU cache of decoded frames with a memory budget.
+
+    Entries are keyed by (path, mtime, decode scale), so a frame changed on
+    disk is never served stale, and sequences sharing an image directory
+    (e.g. Skating2-1 and Skating2-2) share entries. The decode scale is the
+    target size expressed as a DCT scale denominator, so tiles of slightly
+    different sizes hit the same entry. The cache is used from both the GUI
+    thread and the prefetch workers, so it is guarded by a lock.
+    '''
+
+    def __init__(self, budgetMB=512):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        # (path, mtime) -> original image size, to compute the decode scale
+        # of a frame without opening it
+        self.fullSizes = {}
+        # Optional thumbnail store (see thumbcache.py), tried before decoding
+        # the original frame
+        self.thumbs = None
+        # Optional local mirror of the frames (see mirror.py)
+        self.mirror = None
+        self.budget = 0
+        self.usedBytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.setBudget(budgetMB)
+
+    def setBudget(self, budgetMB):
+        with self.lock:
+            self.budget = int(budgetMB * 1024 * 1024)
+            self.evict()
+
+    def setThumbnailStore(self, thumbs):
+        self.thumbs = thumbs
+
+    def setMirror(self, mirror):
+        self.mirror = mirror
+
+    def fileKey(self, path):
+        '''
+        Return (path, mtime) of a frame, or None if the file can not be stat.
+        A packed or archived frame has the mtime recorded in its index, without
+        any stat.
+        '''
+        path = os.path.normpath(os.path.abspath(path))
+        packed = locateFrame(path)
+        if packed is not None:
+            return (path, packed[0].frameMtime(packed[1]))
+        if self.mirror is not None:
+            # A mirrored frame has the mtime of its source
+            mirrored = self.mirror.lookup(path)
+            if mirrored is not None:
+                return (path, mirrored[1])
+        try:
+            mtime = os.path.getmtime(plainPath(path))
+        except OSError:
+            return None
+        return (path, mtime)
+
+    def makeKey(self, fileKey, size=None):
+        '''
+        Return the cache key of a frame displayed at `size` (None means full
+        resolution), or None if the frame has never been decoded.
+        '''
+        if size is None:
+            return fileKey + (1,)
+        with self.lock:
+            fullSize = self.fullSizes.get(fileKey)
+        if fullSize is None and self.thumbs is not None:
+            thumb = self.thumbs.lookup(*fileKey)
+            if thumb is not None:
+                fullSize = QtCore.QSize(*thumb[1])
+        if fullSize is None:
+            return None
+        return fileKey + (reduceFactor(fullSize, size),)
+
+    def get(self, key):
+        with self.lock:
+            frame = self.entries.get(key)
+            if frame is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            # Move to the most recently used end
+            del self.entries[key]
+            self.entries[key] = frame
+            return frame
+
+    def contains(self, key):
+        with self.lock:
+            return key in self.entries
+
+    def put(self, key, frame):
+        cost = frame.byteCount()
+        with self.lock:
+            self.fullSizes[key[:2]] = frame.fullSize
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.usedBytes -= old.byteCount()
+            if cost > self.budget:
+                # Never cache a frame bigger than the whole budget
+                return
+            self.entries[key] = frame
+            self.usedBytes += cost
+            self.evict()
+
+    def evict(self):
+        '''
+        Drop least recently used entries until the budget is respected.
+        The lock must be held by the caller.
+        '''
+        while self.usedBytes > self.budget and self.entries:
+            _, frame = self.entries.popitem(last=False)
+            self.usedBytes -= frame.byteCount()
+            self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.fullSizes.clear()
+            self.usedBytes = 0
+
+    def load(self, path, size=None):
+        '''
+        Return the Frame at `path` decoded for display at `size` (None means
+        full resolution), from the cache if possible.
+        Safe to call from worker threads, it only produces a QImage.
+        '''
+        fileKey = self.fileKey(path)
+        if fileKey is not None:
+            frame = self.get(self.makeKey(fileKey, size))
+            if frame is not None:
+                return frame
+        key, frame = self.decode(path, size, fileKey)
+        if key is not None:
+            self.put(key, frame)
+        return frame
+
+    def decode(self, path, size=None, fileKey=None):
+        '''
+        Return (cache key, Frame) of the frame at `path` decoded for `size`,
+        without caching it. The key is None if the frame can not be cached.
+        '''
+        if fileKey is None:
+            fileKey = self.fileKey(path)
+        frame = None
+        if fileKey is not None and size is not None:
+            frame = self.loadThumb(fileKey, size)
+        if frame is None and self.mirror is not None:
+            mirrored = self.mirror.lookup(path)
+            if mirrored is not None:
+                frame = decodeFrame(mirrored[0], size)
+                if frame.isNull():
+                    # Evicted meanwhile, read the source
+                    frame = None
+        if frame is None:
+            frame = decodeFrame(path, size)
+        if fileKey is None or frame.isNull():
+            return None, frame
+        return fileKey + (frame.reduce,), frame
+
+    def loadThumb(self, fileKey, size):
+        '''
+        Return the Frame read from an up to date thumbnail which is fine
+        enough for `size`, or None.
+        '''
+        if self.thumbs is None:
+            return None
+        thumb = self.thumbs.lookup(*fileKey)
+        if thumb is None:
+            return None
+        thumbPath, (width, height) = thumb
+        fullSize = QtCore.QSize(width, height)
+        factor = reduceFactor(fullSize, size)
+        # The thumbnail must be at least as fine as the reduced decode
+        thumbW, thumbH = self.thumbs.size
+        if min(thumbW / float(width), thumbH / float(height)) * factor < 1:
+            return None
+        image = QtGui.QImage(thumbPath)
+        if image.isNull():
+            return None
+        return Frame(image, fullSize, factor)
+
+    def isCached(self, path, size=None):
+        fileKey = self.fileKey(path)
+        if fileKey is None:
+            return False
+        key = self.makeKey(fileKey, size)
+        return key is not None and self.contains(key)
+
+    def stats(self):
+        with self.lock:
+            return {'entries': len(self.entries),
+                    'usedMB': self.usedBytes / (1024.0 * 1024.0),
+                    'budgetMB': self.budget / (1024.0 * 1024.0),
+                    'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions}
+
+
+# Shared by all annotator widgets, the image window and the prefetcher
+frameCache = FrameCache()
@@ -0,0 +1,208 @@
+# coding: utf-8
+# python2
+
+'''
+Packed frame store.
+
+Opening thousands of small frame files is slow on network filesystems, so a
+sequence can be packed into data/imageFiles/<seq>/img.pack: the encoded frames
+concatenated as they are, followed by an index of their names, offsets, sizes
+and original mtimes. The pack is memory-mapped once, reading a frame is a
+slice of the mapping.
+
+A pack is used as if it was the image directory: the frame `0001.jpg` of a
+packed sequence has the path <seq>/img.pack/0001.jpg. Frames missing from the
+pack are read from the plain <seq>/img directory, and sequences without a pack
+are read from img/ as before.
+
+Pack (or update) the sequences with:
+
+    python framepack.py [--data ./data] [SEQ ...]
+'''
+
+from __future__ import print_function
+import os
+import os.path
+import sys
+import json
+import mmap
+import zlib
+import shutil
+import struct
+import argparse
+import threading
+from fileutil import writeAtomic
+
+packName = 'img.pack'
+magic = 'OFPK'
+packVersion = 1
+# magic, version, index offset, index length
+packHeader = struct.Struct('<4sIQQ')
+
+# pack path -> FramePack, or None if the pack is missing or broken
+packs = {}
+packsLock = threading.Lock()
+
+
+class FramePack(object):
+    '''
+    Read-only, memory-mapped pack of the encoded frames of a sequence.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.mtime = os.path.getmtime(path)
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        tag, version, indexOffset, indexLen = packHeader.unpack_from(self.map)
+        if tag != magic or version != packVersion:
+            self.map.close()
+            raise ValueError('%s is not a frame pack' % path)
+        index = json.loads(zlib.decompress(
+            self.map[indexOffset:indexOffset + indexLen]))
+        self.names = index['names']
+        # frame name -> (offset, size, original mtime)
+        self.frames = dict(zip(self.names, zip(
+            index['offsets'], index['sizes'], index['mtimes'])))
+
+    def __contains__(self, name):
+        return name in self.frames
+
+    def read(self, name):
+        '''
+        Return the encoded bytes of a frame.
+        '''
+        offset, size, _ = self.frames[name]
+        return self.map[offset:offset + size]
+
+    def frameSize(self, name):
+        return self.frames[name][1]
+
+    def frameMtime(self, name):
+        return self.frames[name][2]
+
+    def close(self):
+        self.map.close()
+
+
+def openPack(path, mtime=None):
+    '''
+    Return the FramePack at `path`, or None if there is no valid pack.
+    Opened packs are kept, they are reopened only when `mtime` is given and
+    differs from the mtime of the opened pack.
+    '''
+    path = os.path.normpath(os.path.abspath(path))
+    with packsLock:
+        if path in packs:
+            pack = packs[path]
+            current = pack.mtime if pack is not None else None
+            if mtime is None or mtime == current:
+                return pack
+            # Do not close the old mapping, frames may be read from it
+        try:
+            pack = FramePack(path)
+        except (IOError, OSError, ValueError, struct.error, zlib.error):
+            pack = None
+        packs[path] = pack
+        return pack
+
+
+def isPackPath(path):
+    return os.path.basename(path) == packName
+
+
+def locate(path):
+    '''
+    Return (pack, frame name) of a frame read from a pack, or None.
+    '''
+    packPath, name = os.path.split(path)
+    if not isPackPath(packPath):
+        return None
+    pack = openPack(packPath)
+    if pack is None or name not in pack:
+        return None
+    return pack, name
+
+
+def plainPath(path):
+    '''
+    Return the path of a frame in the plain image directory, for frames
+    which can not be read from their pack.
+    '''
+    packPath, name = os.path.split(path)
+    if not isPackPath(packPath):
+        return path
+    return os.path.join(os.path.dirname(packPath), 'img', name)
+
+
+def writePack(imgDir, names, packPath):
+    '''
+    Pack the frames `names` of imgDir into packPath.
+    '''
+    offsets, sizes, mtimes = [], [], []
+
+    def writer(f):
+        f.write(packHeader.pack(magic, packVersion, 0, 0))
+        for name in names:
+            framePath = os.path.join(imgDir, name)
+            offsets.append(f.tell())
+            with open(framePath, 'rb') as src:
+                shutil.copyfileobj(src, f, 1024 * 1024)
+            sizes.append(f.tell() - offsets[-1])
+            mtimes.append(os.path.getmtime(framePath))
+        index = zlib.compress(json.dumps(
+            {'names': list(names), 'offsets': offsets, 'sizes': sizes,
+             'mtimes': mtimes}, separators=(',', ':')).encode('utf-8'))
+        indexOffset = f.tell()
+        f.write(index)
+        f.seek(0)
+        f.write(packHeader.pack(magic, packVersion, indexOffset, len(index)))
+    writeAtomic(packPath, writer)
+
+
+def packOutdated(imgDir, names, packPath):
+    '''
+    Return True if the pack is missing or does not match the frames of imgDir.
+    '''
+    try:
+        pack = FramePack(packPath)
+    except (IOError, OSError, ValueError, struct.error, zlib.error):
+        return True
+    try:
+        if pack.names != names:
+            return True
+        for name in names:
+            st = os.stat(os.path.join(imgDir, name))
+            if st.st_size != pack.frameSize(name) or \
+                    st.st_mtime != pack.frameMtime(name):
+                return True
+        return False
+    finally:
+        pack.close()
+
+
+if __name__ == '__main__':
+    from dataset import validExt, ignoredSeq
+    parser = argparse.ArgumentParser(
+        description='Pack the frames of every sequence into one file.')
+    parser.add_argument('--data', default='./data',
+                        help='data root containing imageFiles')
+    parser.add_argument('seqs', nargs='*',
+                        help='sequence directories to pack (default: all)')
+    args = parser.parse_args()
+    imageRoot = os.path.join(args.data, 'imageFiles')
+    seqs = args.seqs or sorted(seq for seq in os.listdir(imageRoot)
+                               if seq not in ignoredSeq)
+    for seq in seqs:
+        imgDir = os.path.join(imageRoot, seq, 'img')
+        if not os.path.isdir(imgDir):
+            continue
+        names = sorted(fn for fn in os.listdir(imgDir)
+                       if any(fn.endswith(ext) for ext in validExt))
+        packPath = os.path.join(imageRoot, seq, packName)
+        if not packOutdated(imgDir, names, packPath):
+            print('%s: up to date' % seq)
+            continue
+        writePack(imgDir, names, packPath)
+        print('%s: packed %d frames' % (seq, len(names)))
+    sys.exit(0)
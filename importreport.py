@@ -0,0 +1,76 @@
+# coding: utf-8
+# python2
+
+'''
+Import-time report, enabled with `python annotator.py --import-report`.
+
+Once installed, every first import of a module is timed, and report() prints
+the slowest ones with the time at which startup milestones were reached.
+The time of a module excludes the modules it imports itself.
+'''
+
+from __future__ import print_function
+import sys
+import time
+import threading
+import __builtin__
+
+startTime = time.time()
+installed = False
+originalImport = __builtin__.__import__
+
+# [module name, total seconds, own seconds, thread name]
+imports = []
+# [label, seconds since start]
+milestones = []
+# Per-thread stack of the time spent in nested imports
+local = threading.local()
+
+
+def timedImport(name, *args, **kwargs):
+    fresh = name not in sys.modules
+    stack = getattr(local, 'stack', None)
+    if stack is None:
+        stack = local.stack = []
+    stack.append(0.0)
+    start = time.time()
+    try:
+        return originalImport(name, *args, **kwargs)
+    finally:
+        elapsed = time.time() - start
+        nested = stack.pop()
+        if stack:
+            stack[-1] += elapsed
+        if fresh and name in sys.modules:
+            imports.append([name, elapsed, elapsed - nested,
+                            threading.current_thread().name])
+
+
+def install():
+    global installed
+    if not installed:
+        __builtin__.__import__ = timedImport
+        installed = True
+
+
+def mark(label):
+    if installed:
+        milestones.append([label, time.time() - startTime])
+
+
+def report(count=15, out=sys.stdout):
+    '''
+    Print the milestones and the `count` slowest imports so far.
+    '''
+    if not installed:
+        return
+    print('Startup milestones:', file=out)
+    for label, seconds in milestones:
+        print('  %7.3fs  %s' % (seconds, label), file=out)
+    total = sum(own for _, _, own, _ in imports)
+    print('Imports: %d modules, %.3fs, slowest:' % (len(imports), total),
+          file=out)
+    for name, elapsed, own, thread in sorted(
+            imports, key=lambda i: -i[2])[:count]:
+        print('  %7.3fs own  %7.3fs total  %s (%s)' %
+              (own, elapsed, name, thread), file=out)
@@ -0,0 +1,141 @@
+# coding: utf-8
+# python2
+
+from __future__ import print_function
+import os
+import time
+import struct
+import threading
+from fileutil import writeAtomic, fsyncDir
+
+# frame index, new attribution, timestamp
+recordFormat = struct.Struct('<IBd')
+
+# One journal object per file, shared by the GUI and the loader thread
+journals = {}
+journalsLock = threading.Lock()
+
+
+def openJournal(seqAttrFile):
+    '''
+    Return the journal of a sequence.
+    '''
+    with journalsLock:
+        journal = journals.get(seqAttrFile)
+        if journal is None:
+            journal = LabelJournal(seqAttrFile)
+            journals[seqAttrFile] = journal
+        return journal
+
+
+class LabelJournal(object):
+    '''
+    Append-only journal of the attribution changes of one sequence.
+
+    Every click appends a small record to `<seqAttrFile>.journal`, so a crash
+    loses nothing even if the mat file has not been saved yet. The journal is
+    replayed on top of the mat file when the sequence is read, and compacted
+    (the records already in the mat file are dropped) after every save.
+    '''
+
+    def __init__(self, seqAttrFile, durable=True):
+        self.path = seqAttrFile + '.journal'
+        # fsync every record, so it survives a power loss
+        self.durable = durable
+        self.lock = threading.Lock()
+        self.file = None
+        # Bytes dropped by compactions, offsets are counted from the first
+        # record ever written so snapshots stay valid across compactions
+        self.compacted = 0
+
+    def append(self, frameIdx, label):
+        self.appendRange(frameIdx, frameIdx + 1, label)
+
+    def appendRange(self, start, end, label):
+        '''
+        Append the records of frames [start, end), with a single fsync.
+        '''
+        now = time.time()
+        data = ''.join(recordFormat.pack(frameIdx, label, now)
+                       for frameIdx in range(start, end))
+        with self.lock:
+            created = False
+            if self.file is None:
+                created = not os.path.exists(self.path)
+                self.file = open(self.path, 'ab')
+            self.file.write(data)
+            self.file.flush()
+            if self.durable:
+                os.fsync(self.file.fileno())
+                if created:
+                    # The new file itself must survive a power loss too
+                    fsyncDir(os.path.dirname(self.path))
+
+    def offset(self):
+        '''
+        Return the end offset of the journal, records before this offset are
+        part of a labels snapshot taken now.
+        '''
+        with self.lock:
+            if self.file is not None:
+                return self.compacted + self.file.tell()
+            try:
+                return self.compacted + os.path.getsize(self.path)
+            except OSError:
+                return self.compacted
+
+    def compact(self, offset):
+        '''
+        Drop the records before `offset`, they have been saved to the mat file.
+        Records appended since the snapshot are kept. The mat file must be on
+        disk already (saveLabels syncs it), or a power loss could lose both.
+        '''
+        with self.lock:
+            dropped = offset - self.compacted
+            if dropped <= 0:
+                return
+            self.closeFile()
+            try:
+                with open(self.path, 'rb') as f:
+                    f.seek(dropped)
+                    tail = f.read()
+            except IOError:
+                return
+            self.compacted = offset
+            if not tail:
+                os.remove(self.path)
+                if self.durable:
+                    fsyncDir(os.path.dirname(self.path))
+                return
+            writeAtomic(self.path, lambda f: f.write(tail),
+                        durable=self.durable)
+
+    def close(self):
+        with self.lock:
+            self.closeFile()
+
+    def closeFile(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    @staticmethod
+    def replay(seqAttrFile, labels):
+        '''
+        Apply the journal of a sequence on its labels read from the mat file.
+        Return the number of records applied.
+        '''
+        try:
+            with open(seqAttrFile + '.journal', 'rb') as f:
+                data = f.read()
+        except IOError:
+            return 0
+        count = 0
+        size = recordFormat.size
+        # A record cut by a crash at the end of the file is ignored
+        for pos in range(0, len(data) - size + 1, size):
+            frameIdx, label, _ = recordFormat.unpack_from(data, pos)
+            if frameIdx < len(labels):
+                labels[frameIdx] = label
+                count += 1
+        return count
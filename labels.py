@@ -0,0 +1,197 @@
+# coding: utf-8
+# python2
+
+# Attribution mapping of the legacy mat files:
+# 0 -> Not annotated
+# 1 -> Occlusion
+# 2 -> Deformation
+# 3 -> Blur
+# 4 -> Occlusion + Blur
+#
+# In memory every frame is a uint8 with one bit per attribute of the schema,
+# so any combination (e.g. Occlusion + Deformation) can be expressed.
+
+from __future__ import print_function
+import numpy as np
+from matfile import readMat, writeMat, MatFileError
+from fileutil import writeAtomic
+
+# Every attribute is [short name, full name, button color], its bit is given
+# by its position in the schema (at most 8 attributes)
+defaultSchema = [['O', 'Occlusion', 'LightCoral'],
+                 ['D', 'Deformation', 'Chartreuse'],
+                 ['B', 'Blur', 'Aquamarine']]
+
+# Legacy code -> short names of its attributes
+legacyCodes = [[], ['O'], ['D'], ['B'], ['O', 'B']]
+
+
+def legacyTables(schema):
+    '''
+    Return the (legacy code -> flags, flags -> legacy code) lookup tables of a
+    schema. A combination without legacy code is written as the legacy code
+    covering most of its attributes.
+    '''
+    bits = dict((attr[0], 1 << i) for i, attr in enumerate(schema))
+    toFlags = np.zeros(len(legacyCodes), np.uint8)
+    for code, names in enumerate(legacyCodes):
+        for name in names:
+            toFlags[code] |= bits.get(name, 0)
+    toLegacy = np.zeros(256, np.uint8)
+    for flags in range(256):
+        best, bestCount = 0, 0
+        for code in range(1, len(legacyCodes)):
+            covered = int(toFlags[code])
+            if covered == 0 or covered & flags != covered:
+                continue
+            count = bin(covered).count('1')
+            if count > bestCount:
+                best, bestCount = code, count
+        toLegacy[flags] = best
+    return toFlags, toLegacy
+
+
+class LabelStore(object):
+    '''
+    Attribution data of a sequence, one uint8 of attribute bits per frame.
+
+    Indexing works like a NumPy array: an int gives the flags of a frame, a
+    slice gives a view, and assigning to a slice labels a whole range at once.
+    '''
+
+    def __init__(self, flags, schema=defaultSchema):
+        self.flags = np.asarray(flags, np.uint8)
+        self.schema = schema
+
+    @classmethod
+    def empty(cls, seqLen, schema=defaultSchema):
+        return cls(np.zeros(seqLen, np.uint8), schema)
+
+    @classmethod
+    def fromLegacy(cls, codes, seqLen=None, schema=defaultSchema):
+        '''
+        Build a store from legacy 0-4 codes, padded by 0 up to seqLen. Codes
+        beyond seqLen are kept, so saving never drops annotations.
+        Raise ValueError on an unknown code rather than saving another one.
+        '''
+        toFlags, _ = legacyTables(schema)
+        codes = np.asarray(codes, np.int64).ravel()
+        unknown = np.flatnonzero((codes < 0) | (codes >= len(legacyCodes)))
+        if len(unknown):
+            raise ValueError('Unknown legacy code %d at frame %d' %
+                             (codes[unknown[0]], unknown[0]))
+        flags = np.zeros(max(seqLen or 0, len(codes)), np.uint8)
+        flags[:len(codes)] = toFlags[codes]
+        return cls(flags, schema)
+
+    def toLegacy(self):
+        '''
+        Return the legacy 0-4 codes, and whether every frame is representable.
+        '''
+        toFlags, toLegacy = legacyTables(self.schema)
+        codes = toLegacy[self.flags]
+        exact = bool(np.all(toFlags[codes] == self.flags))
+        return codes, exact
+
+    def __len__(self):
+        return len(self.flags)
+
+    def __getitem__(self, idx):
+        value = self.flags[idx]
+        if isinstance(value, np.ndarray):
+            return value
+        return int(value)
+
+    def __setitem__(self, idx, value):
+        self.flags[idx] = value
+
+    def copy(self):
+        return LabelStore(self.flags.copy(), self.schema)
+
+    def bit(self, attr):
+        '''
+        Return the bit of an attribute given by index or short name.
+        '''
+        if not isinstance(attr, int):
+            attr = [a[0] for a in self.schema].index(attr)
+        return 1 << attr
+
+    def setRange(self, start, end, flags):
+        self.flags[start:end] = flags
+
+    def addRange(self, start, end, attr):
+        self.flags[start:end] |= self.bit(attr)
+
+    def clearRange(self, start, end, attr):
+        self.flags[start:end] &= ~np.uint8(self.bit(attr))
+
+    def has(self, attr):
+        '''
+        Return a boolean array of the frames having the attribute.
+        '''
+        return (self.flags & self.bit(attr)) != 0
+
+    def counts(self):
+        '''
+        Return {short name: number of frames} and the annotated frame count.
+        '''
+        counts = dict((a[0], int(np.count_nonzero(self.has(i))))
+                      for i, a in enumerate(self.schema))
+        return counts, int(np.count_nonzero(self.flags))
+
+
+def readLabels(seqAttrFile, seqLen, log=False, schema=defaultSchema):
+    '''
+    Read the attribution data of a sequence from its mat file.
+    If the file does not exist, init it by all 0.
+    Without seqLen, the length of the saved data is used. Saved frames beyond
+    seqLen are kept, and an unknown legacy code raises ValueError.
+    '''
+    try:
+        try:
+            mat = readMat(seqAttrFile)
+        except MatFileError:
+            # Written by another tool with a part of the format matfile.py
+            # does not read, SciPy is slow to import but reads it
+            from scipy.io import loadmat
+            mat = loadmat(seqAttrFile)
+        if log:
+            print('Succesfully load mat file %s' % seqAttrFile)
+        if 'flags' in mat:
+            # Written with combinations the legacy codes can not express
+            rawData = mat['flags'].ravel()
+            # Frames beyond seqLen are kept, like fromLegacy
+            labels = LabelStore.empty(max(seqLen or 0, len(rawData)), schema)
+            labels[:len(rawData)] = rawData
+        else:
+            rawData = mat['label'].ravel()
+            labels = LabelStore.fromLegacy(rawData, seqLen, schema)
+        if seqLen is not None and len(rawData) < seqLen and log:
+            # If some frame have not been annotated, then use 0 to fill it.
+            print('Only %d frames of %s have been annotated before.' %
+                  (len(rawData), seqAttrFile))
+            print('Padding the attribution data by 0')
+    except IOError:
+        print('No mat file found for %s' % seqAttrFile)
+        labels = LabelStore.empty(seqLen or 0, schema)
+        print('Init the attribution data by 0')
+    return labels
+
+
+def saveLabels(seqAttrFile, labels, log=False):
+    '''
+    Save the attribution data of a sequence as a `label` column vector of
+    legacy codes. If some frame has a combination without legacy code, the
+    attribute bits are saved as well in a `flags` column vector.
+    The file is written next to the target, synced to disk, then renamed, so
+    neither a crash nor a power loss while saving leaves a truncated mat file.
+    '''
+    codes, exact = labels.toLegacy()
+    # Reshape the attribute list to matrix
+    saveData = {'label': codes.astype(np.int64).reshape(-1, 1)}
+    if not exact:
+        saveData['flags'] = labels.flags.reshape(-1, 1)
+    target = seqAttrFile + '.mat'
+    writeAtomic(target, lambda f: writeMat(f, saveData))
+    if log:
+        print('Save to %s\n' % target)
@@ -0,0 +1,275 @@
+# coding: utf-8
+# python2
+
+from __future__ import print_function
+import os.path
+import Queue
+import importlib
+import threading
+from collections import OrderedDict
+from PyQt4 import QtCore
+from framecache import frameCache
+from labels import readLabels, saveLabels
+from journal import LabelJournal
+from summary import labelsStamp
+
+
+class SequenceLoader(QtCore.QThread):
+    '''
+    Open sequences and save attribution data off the GUI thread.
+
+    Jobs are run one at a time in the order they were queued, so the labels of
+    a sequence are always saved before the sequence can be read again, and two
+    saves of the same file never overlap. Saves of a file which are queued but
+    not started yet are coalesced, only the latest labels are written. Every
+    load gets a generation number: requesting another load or cancelling makes
+    the running one stop at its next step, and its results are ignored.
+
+    Once a sequence is open, its neighbours in the list can be warmed up: their
+    manifest entry, ground-truth, labels and first page are read ahead, so
+    opening one of them is immediate. Warm-up jobs are queued after the others
+    and stop as soon as another load is requested. Their results are kept
+    within a memory budget, oldest first out.
+    '''
+
+    # generation, done steps, total steps, message
+    progress = QtCore.pyqtSignal(int, int, int, str)
+    # generation, dict with the manifest entry and the ground-truth
+    firstPageReady = QtCore.pyqtSignal(int, object)
+    # generation, LabelStore
+    labelsReady = QtCore.pyqtSignal(int, object)
+    # generation (-1 for a save), error message
+    failed = QtCore.pyqtSignal(int, str)
+    # attribution file which has been written
+    saved = QtCore.pyqtSignal(str)
+
+    def __init__(self, manifest, schema, parent=None, warmupMB=128):
+        super(SequenceLoader, self).__init__(parent)
+        self.manifest = manifest
+        self.schema = schema
+        self.jobs = Queue.Queue()
+        # attribution file -> latest labels waiting to be written
+        self.pendingSaves = {}
+        self.saveLock = threading.Lock()
+        # Generation of the latest requested load
+        self.generation = 0
+        # seq -> (warmed up data, its cost in bytes), only used by the thread
+        self.warmed = OrderedDict()
+        self.warmBudget = int(warmupMB * 1024 * 1024)
+        self.warmBytes = 0
+        # Summary index updated by every save (see summary.py), or None
+        self.summary = None
+        self.log = False
+
+    def load(self, seq, seqAttrFile, pageSize, tileSize):
+        '''
+        Queue the loading of a sequence, return its generation number.
+        '''
+        self.generation += 1
+        self.jobs.put(('load', self.generation, seq, seqAttrFile, pageSize,
+                       tileSize))
+        return self.generation
+
+    def warm(self, seqs, pageSize, tileSize):
+        '''
+        Queue the warm-up of [(seq, seqAttrFile)], in this order. It is
+        dropped by the next load.
+        '''
+        self.jobs.put(('warm', self.generation, list(seqs), pageSize,
+                       tileSize))
+
+    def preload(self, modules):
+        '''
+        Queue the import of modules which are needed to open a sequence, so
+        the first one opens without waiting for them.
+        '''
+        self.jobs.put(('preload', list(modules)))
+
+    def save(self, seqAttrFile, labels, journal=None):
+        '''
+        Queue the saving of attribution data, `labels` must not be shared.
+        The records of `journal` written so far are compacted once the mat
+        file is saved.
+        '''
+        offset = journal.offset() if journal is not None else 0
+        with self.saveLock:
+            queued = seqAttrFile in self.pendingSaves
+            self.pendingSaves[seqAttrFile] = (labels, journal, offset)
+        if not queued:
+            self.jobs.put(('save', seqAttrFile))
+
+    def runSave(self, seqAttrFile):
+        with self.saveLock:
+            pending = self.pendingSaves.pop(seqAttrFile, None)
+        if pending is None:
+            return
+        labels, journal, offset = pending
+        # Labels warmed up before this save are outdated
+        for seq, (warmed, _) in self.warmed.items():
+            if warmed['seqAttrFile'] == seqAttrFile:
+                self.dropWarm(seq)
+        try:
+            # The mat file is synced to disk before the journal drops the
+            # records it holds
+            saveLabels(seqAttrFile, labels, self.log)
+            if journal is not None:
+                journal.compact(offset)
+            if self.summary is not None:
+                self.summary.update(os.path.basename(seqAttrFile), labels)
+        except Exception as e:
+            self.failed.emit(-1, 'When save %s, %s' % (seqAttrFile, e))
+        else:
+            self.saved.emit(seqAttrFile)
+
+    def cancel(self):
+        self.generation += 1
+
+    def cancelled(self, generation):
+        return generation != self.generation
+
+    def stop(self):
+        '''
+        Finish the queued saves, then stop the thread.
+        '''
+        self.cancel()
+        self.jobs.put(None)
+        self.wait()
+
+    def run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            if job[0] == 'save':
+                self.runSave(job[1])
+            elif job[0] == 'preload':
+                for name in job[1]:
+                    try:
+                        importlib.import_module(name)
+                    except ImportError as e:
+                        print('When import %s, %s' % (name, e))
+            elif self.cancelled(job[1]):
+                continue
+            elif job[0] == 'warm':
+                try:
+                    self.runWarm(*job[1:])
+                except Exception as e:
+                    # Speculative, the sequence is read again when opened
+                    if self.log:
+                        print('When warm up, %s' % e)
+            else:
+                try:
+                    self.runLoad(*job[1:])
+                except Exception as e:
+                    self.failed.emit(job[1], 'When load %s, %s' % (job[2], e))
+
+    def runLoad(self, generation, seq, seqAttrFile, pageSize, tileSize):
+        self.progress.emit(generation, 0, pageSize + 2, 'Reading frame list')
+        warmed = self.takeWarm(seq, seqAttrFile)
+        entry = self.manifest.entry(seq)
+        if warmed is not None and warmed['entry'] is entry:
+            gts = warmed['gts']
+        else:
+            gts = self.manifest.groundTruth(seq, entry)
+        imagePaths = [os.path.join(entry['imgDir'], imgName)
+                      for imgName in entry['imgNames'][:pageSize]]
+        total = len(imagePaths) + 2
+        self.progress.emit(generation, 1, total, 'Decoding first page')
+
+        # Decode the first page into the frame cache
+        for i, imagePath in enumerate(imagePaths):
+            if self.cancelled(generation):
+                return
+            frameCache.load(imagePath, tileSize)
+            self.progress.emit(generation, i + 2, total, 'Decoding first page')
+        self.firstPageReady.emit(generation, {'entry': entry, 'gts': gts})
+
+        if self.cancelled(generation):
+            return
+        self.progress.emit(generation, total - 1, total, 'Reading attributions')
+        if warmed is not None and warmed['entry'] is entry:
+            labels = warmed['labels']
+        else:
+            labels = self.readLabels(seq, seqAttrFile, len(entry['imgNames']))
+        self.labelsReady.emit(generation, labels)
+        self.progress.emit(generation, total, total, 'Done')
+
+    def readLabels(self, seq, seqAttrFile, seqLen):
+        labels = readLabels(seqAttrFile, seqLen, self.log, self.schema)
+        # Changes not compacted into the mat file yet
+        replayed = LabelJournal.replay(seqAttrFile, labels)
+        if self.log and replayed:
+            print('Replay %d journal records for %s' % (replayed, seq))
+        return labels
+
+    @staticmethod
+    def labelsStamp(seqAttrFile):
+        '''
+        Return what changes when the labels of a sequence are written.
+        '''
+        return labelsStamp(seqAttrFile)
+
+    def runWarm(self, generation, seqs, pageSize, tileSize):
+        for seq, seqAttrFile in seqs:
+            if self.cancelled(generation):
+                return
+            if seq in self.warmed:
+                # Keep it as the most recently warmed
+                self.warmed[seq] = self.warmed.pop(seq)
+                continue
+            entry = self.manifest.entry(seq)
+            gts = self.manifest.groundTruth(seq, entry)
+            stamp = self.labelsStamp(seqAttrFile)
+            labels = self.readLabels(seq, seqAttrFile, len(entry['imgNames']))
+            cost = labels.flags.nbytes + gts.nbytes
+            # Kept out of the frame cache until the sequence is opened, so
+            # they never evict the frames of the open one and are freed with
+            # the warmed up data
+            frames = []
+            for imgName in entry['imgNames'][:pageSize]:
+                if self.cancelled(generation):
+                    return
+                if self.warmBytes + cost > self.warmBudget:
+                    # Out of budget, the rest is decoded when opened
+                    break
+                imagePath = os.path.join(entry['imgDir'], imgName)
+                if not frameCache.isCached(imagePath, tileSize):
+                    key, frame = frameCache.decode(imagePath, tileSize)
+                    if key is not None:
+                        frames.append((key, frame))
+                        cost += frame.byteCount()
+            self.putWarm(seq, {'seqAttrFile': seqAttrFile, 'entry': entry,
+                               'gts': gts, 'labels': labels,
+                               'frames': frames, 'stamp': stamp}, cost)
+            if self.log:
+                print('Warm up %s, %d KB' % (seq, cost // 1024))
+
+    def putWarm(self, seq, warmed, cost):
+        self.warmed[seq] = (warmed, cost)
+        self.warmBytes += cost
+        while self.warmBytes > self.warmBudget and len(self.warmed) > 1:
+            self.dropWarm(next(iter(self.warmed)))
+
+    def dropWarm(self, seq):
+        '''
+        Forget the warmed up data of a sequence, which frees its frames.
+        '''
+        _, cost = self.warmed.pop(seq)
+        self.warmBytes -= cost
+
+    def takeWarm(self, seq, seqAttrFile):
+        '''
+        Return the warmed up data of a sequence if its labels did not change
+        since, else None. It is handed over to the caller.
+        '''
+        if seq not in self.warmed:
+            return None
+        warmed, _ = self.warmed[seq]
+        self.dropWarm(seq)
+        # The frames do not depend on the labels
+        for key, frame in warmed['frames']:
+            frameCache.put(key, frame)
+        if warmed['seqAttrFile'] != seqAttrFile or \
+                warmed['stamp'] != self.labelsStamp(seqAttrFile):
+            return None
+        return warmed
@@ -0,0 +1,198 @@
+# coding: utf-8
+# python2
+
+'''
+Reader and writer of the MAT v5 files holding the attribution data.
+
+Only the subset used by the annotation files is supported: real numeric
+matrices, each in its own element, optionally zlib-compressed. Files are
+written byte for byte like scipy.io.savemat(f, variables,
+do_compression=True) on a little-endian machine (except for the creation
+date of the header), so SciPy and MATLAB read them as before, without
+importing SciPy in the annotator.
+
+Layout of a file:
+    128 bytes header: text, subsystem offset, version 0x0100, 'IM'
+    one element per variable, either miMATRIX or miCOMPRESSED (the zlib
+    stream of a miMATRIX element)
+A miMATRIX element contains the array flags (class and flags as miUINT32),
+the int32 dimensions, the miINT8 name and the column-major data. Elements
+of at most 4 bytes are stored in the tag itself.
+'''
+
+from __future__ import print_function
+import os
+import time
+import zlib
+import struct
+import numpy as np
+
+miINT8 = 1
+miUINT32 = 6
+miINT32 = 5
+miMATRIX = 14
+miCOMPRESSED = 15
+
+# Data element type -> NumPy type
+miTypes = {1: 'i1', 2: 'u1', 3: 'i2', 4: 'u2', 5: 'i4', 6: 'u4', 7: 'f4',
+           9: 'f8', 12: 'i8', 13: 'u8'}
+# Array class -> NumPy type
+mxTypes = {6: 'f8', 7: 'f4', 8: 'i1', 9: 'u1', 10: 'i2', 11: 'u2', 12: 'i4',
+           13: 'u4', 14: 'i8', 15: 'u8'}
+npToMi = dict((v, k) for k, v in miTypes.items())
+npToMx = dict((v, k) for k, v in mxTypes.items())
+# Booleans are written as logical uint8, like savemat
+npToMi['b1'] = 2
+npToMx['b1'] = 9
+
+logicalFlag = 2
+complexFlag = 8
+
+headerText = 'MATLAB 5.0 MAT-file Platform: %s, Created on: %s'
+
+
+class MatFileError(ValueError):
+    '''
+    The file is not a MAT v5 file, or uses a part of the format which is not
+    supported (sparse, cell, struct, char or complex arrays).
+    '''
+    pass
+
+
+def readElement(data, pos, order):
+    '''
+    Return (data type, content, position of the next element) of the element
+    at `pos`.
+    '''
+    if pos + 8 > len(data):
+        raise MatFileError('Truncated element')
+    mdtype, = struct.unpack_from(order + 'I', data, pos)
+    if mdtype >> 16:
+        # Small element, the content is in the second half of the tag
+        size = mdtype >> 16
+        return mdtype & 0xffff, data[pos + 4:pos + 4 + size], pos + 8
+    size, = struct.unpack_from(order + 'I', data, pos + 4)
+    start = pos + 8
+    if start + size > len(data):
+        raise MatFileError('Truncated element')
+    if mdtype == miCOMPRESSED:
+        # Compressed elements are not padded
+        end = start + size
+    else:
+        end = start + (size + 7) // 8 * 8
+    return mdtype, data[start:start + size], end
+
+
+def readMatrix(data, order):
+    '''
+    Return (name, array) of the content of a miMATRIX element.
+    '''
+    _, flags, pos = readElement(data, 0, order)
+    flagsClass, = struct.unpack_from(order + 'I', flags)
+    mclass, flags = flagsClass & 0xff, flagsClass >> 8
+    _, dims, pos = readElement(data, pos, order)
+    dims = np.frombuffer(dims, order + 'i4')
+    _, name, pos = readElement(data, pos, order)
+    if mclass not in mxTypes or flags & complexFlag:
+        raise MatFileError('Unsupported array %s (class %d)' % (name, mclass))
+    mdtype, raw, pos = readElement(data, pos, order)
+    if mdtype not in miTypes:
+        raise MatFileError('Unsupported data type %d of %s' % (mdtype, name))
+    values = np.frombuffer(raw, order + miTypes[mdtype])
+    # The data may be stored in a smaller type than its class
+    array = values.astype(mxTypes[mclass]).reshape(tuple(dims), order='F')
+    if flags & logicalFlag:
+        array = array.astype(bool)
+    return name, array
+
+
+def parseMat(data):
+    '''
+    Return {name: array} of the content of a MAT file.
+    '''
+    if len(data) < 128:
+        raise MatFileError('Not a MAT file')
+    order = {'IM': '<', 'MI': '>'}.get(data[126:128])
+    if order is None:
+        raise MatFileError('Not a MAT file')
+    version, = struct.unpack_from(order + 'H', data, 124)
+    if version != 0x0100:
+        # e.g. the HDF5 based v7.3 files
+        raise MatFileError('Unsupported MAT file version 0x%04x' % version)
+    variables = {}
+    pos = 128
+    while pos < len(data):
+        mdtype, content, pos = readElement(data, pos, order)
+        if mdtype == miCOMPRESSED:
+            try:
+                content = zlib.decompress(content)
+            except zlib.error as e:
+                raise MatFileError('Broken compressed element, %s' % e)
+            mdtype, content, _ = readElement(content, 0, order)
+        if mdtype != miMATRIX:
+            raise MatFileError('Unsupported element type %d' % mdtype)
+        name, array = readMatrix(content, order)
+        variables[name] = array
+    return variables
+
+
+def readMat(path, appendMat=True):
+    '''
+    Return {name: array} of a MAT file. Like loadmat, '.mat' is appended to
+    a path which does not exist.
+    '''
+    try:
+        f = open(path, 'rb')
+    except IOError:
+        if not appendMat or path.endswith('.mat'):
+            raise
+        f = open(path + '.mat', 'rb')
+    with f:
+        return parseMat(f.read())
+
+
+def packElement(mdtype, data):
+    if len(data) <= 4:
+        return struct.pack('<I', len(data) << 16 | mdtype) + \
+            data.ljust(4, '\0')
+    padding = -len(data) % 8
+    return struct.pack('<II', mdtype, len(data)) + data + '\0' * padding
+
+
+def packMatrix(name, array):
+    '''
+    Return the miMATRIX element of a numeric array.
+    '''
+    array = np.asarray(array)
+    # One dimensional arrays are rows, like savemat
+    if array.ndim == 0:
+        array = array.reshape(1, 1)
+    elif array.ndim == 1:
+        array = array.reshape(1, -1)
+    key = array.dtype.str[1:]
+    if key not in npToMx:
+        raise MatFileError('Unsupported array type %s of %s' %
+                           (array.dtype, name))
+    flags = logicalFlag if array.dtype.kind == 'b' else 0
+    data = array.astype(array.dtype.newbyteorder('<')).tostring(order='F')
+    content = packElement(miUINT32, struct.pack(
+        '<II', npToMx[key] | flags << 8, 0)) + \
+        packElement(miINT32, np.array(array.shape, '<i4').tostring()) + \
+        packElement(miINT8, name) + \
+        packElement(npToMi[key], data)
+    return struct.pack('<II', miMATRIX, len(content)) + content
+
+
+def writeMat(f, variables, compress=True):
+    '''
+    Write {name: array} to the file object f, as savemat does.
+    '''
+    text = headerText % (os.name, time.asctime())
+    f.write(text[:116].ljust(116, '\0') + '\0' * 8 +
+            struct.pack('<H', 0x0100) + 'IM')
+    for name, array in variables.items():
+        element = packMatrix(name, array)
+        if compress:
+            element = zlib.compress(element)
+            f.write(struct.pack('<II', miCOMPRESSED, len(element)))
+        f.write(element)
@@ -0,0 +1,338 @@
+# coding: utf-8
+# python2
+
+'''
+Local mirror of the frames of a remote dataset.
+
+When data/imageFiles is on a network share, every frame read pays the network
+latency. The mirror copies the frames of the active sequence (and of the next
+one in the sequence list) to data/cache/mirror in the background, one image
+directory at a time and in frame order, and the frame cache reads the local
+copy when there is one. The frame list, sizes and mtimes come from the
+manifest, so the remote share is never stat per frame.
+
+The annotator only mirrors a dataset on a network share (see isRemote).
+The mirror is capped in size: whole image directories are evicted, least
+recently used first, never the ones being mirrored. Packed and archived
+sequences are already read through a single mapping and are not mirrored.
+
+Measure it against a share with a simulated latency with:
+
+    python mirror.py [--data ./data] [--latency 0.02] [--bandwidth 20] SEQ...
+'''
+
+from __future__ import print_function
+import os
+import os.path
+import sys
+import json
+import time
+import Queue
+import shutil
+import argparse
+import threading
+from fileutil import writeAtomic
+from framepack import isPackPath
+from archives import splitArchivePath
+
+# Read size of the copies, frames are usually read in one go
+copyChunk = 4 * 1024 * 1024
+
+# Filesystem types of /proc/mounts which are network shares
+remoteFsTypes = set(['nfs', 'nfs4', 'cifs', 'smbfs', 'smb3', 'afs', '9p',
+                     'ceph', 'glusterfs', 'lustre', 'davfs', 'fuse.sshfs',
+                     'fuse.rclone', 'fuse.s3fs'])
+
+
+def isRemote(path):
+    '''
+    Return True if path is on a network share. Only Linux mounts and Windows
+    network drives are detected, other systems return False.
+    '''
+    path = os.path.realpath(path)
+    if os.name == 'nt':
+        if path.startswith('\\\\'):
+            # UNC path
+            return True
+        import ctypes
+        drive = os.path.splitdrive(path)[0] + '\\'
+        # DRIVE_REMOTE
+        return ctypes.windll.kernel32.GetDriveTypeW(unicode(drive)) == 4
+    try:
+        with open('/proc/mounts') as f:
+            mounts = [line.split()[1:3] for line in f]
+    except IOError:
+        return False
+    # The longest mount point containing path is the one it is on
+    best, bestType = '', None
+    for mountPoint, fsType in mounts:
+        mountPoint = mountPoint.replace('\\040', ' ')
+        if (path == mountPoint or
+                path.startswith(mountPoint.rstrip('/') + '/')) and \
+                len(mountPoint) > len(best):
+            best, bestType = mountPoint, fsType
+    return bestType in remoteFsTypes
+
+
+class LatencyOpener(object):
+    '''
+    Opener standing for a remote filesystem: every open waits `latency`
+    seconds, and reads are limited to `bandwidthMB` MB/s.
+    '''
+
+    def __init__(self, latency=0.02, bandwidthMB=None):
+        self.latency = latency
+        self.bandwidth = bandwidthMB * 1024 * 1024 if bandwidthMB else None
+
+    def __call__(self, path, mode='rb'):
+        time.sleep(self.latency)
+        return SlowFile(open(path, mode), self.bandwidth)
+
+
+class SlowFile(object):
+
+    def __init__(self, f, bandwidth):
+        self.f = f
+        self.bandwidth = bandwidth
+
+    def read(self, size=-1):
+        data = self.f.read(size)
+        if self.bandwidth:
+            time.sleep(len(data) / float(self.bandwidth))
+        return data
+
+    def close(self):
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class SequenceMirror(object):
+    '''
+    Read-through local copy of the image directories of the dataset.
+
+    The index maps every mirrored image directory to its last use time and
+    the [mtime, size] of its copied frames, it is kept in index.json.
+    '''
+
+    def __init__(self, manifest, mirrorRoot, capMB=4096, opener=open):
+        self.manifest = manifest
+        self.mirrorRoot = mirrorRoot
+        self.cap = int(capMB * 1024 * 1024)
+        # open(path, mode) of the source frames
+        self.opener = opener
+        self.lock = threading.Lock()
+        self.dirs = self.readIndex()
+        self.usedBytes = sum(self.dirBytes(d) for d in self.dirs.values())
+        # Image directories which must not be evicted
+        self.active = set()
+        self.jobs = Queue.Queue()
+        self.generation = 0
+        self.thread = None
+        self.log = False
+
+    def indexFile(self):
+        return os.path.join(self.mirrorRoot, 'index.json')
+
+    def readIndex(self):
+        try:
+            with open(self.indexFile()) as f:
+                return json.load(f)['dirs']
+        except (IOError, ValueError, KeyError):
+            return {}
+
+    def saveIndex(self):
+        '''
+        The lock must be held by the caller.
+        '''
+        if not os.path.isdir(self.mirrorRoot):
+            os.makedirs(self.mirrorRoot)
+        writeAtomic(self.indexFile(), lambda f: f.write(json.dumps(
+            {'dirs': self.dirs}, separators=(',', ':')).encode('utf-8')),
+            durable=False)
+
+    @staticmethod
+    def dirBytes(record):
+        return sum(size for _, size in record['files'].values())
+
+    def localDir(self, imgDir):
+        rel = os.path.relpath(imgDir, self.manifest.datasetRoot)
+        return os.path.join(self.mirrorRoot, rel)
+
+    def lookup(self, path):
+        '''
+        Return (local path, source mtime) of a mirrored frame, or None.
+        '''
+        imgDir, name = os.path.split(os.path.normpath(os.path.abspath(path)))
+        with self.lock:
+            record = self.dirs.get(imgDir)
+            if record is None:
+                return None
+            stat = record['files'].get(name)
+        if stat is None:
+            return None
+        return os.path.join(self.localDir(imgDir), name), stat[0]
+
+    def setActive(self, seqs):
+        '''
+        Mirror the image directories of `seqs` in this order, stop mirroring
+        the previous ones.
+        '''
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run)
+            self.thread.daemon = True
+            self.thread.start()
+        self.generation += 1
+        self.jobs.put((self.generation, list(seqs)))
+
+    def cancelled(self, generation):
+        return generation != self.generation
+
+    def stop(self):
+        '''
+        Stop after the frame being copied.
+        '''
+        if self.thread is None:
+            return
+        self.generation += 1
+        self.jobs.put(None)
+        self.thread.join()
+        self.thread = None
+
+    def run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            generation, seqs = job
+            if self.cancelled(generation):
+                continue
+            imgDirs = []
+            for seq in seqs:
+                try:
+                    entry = self.manifest.entry(seq)
+                except Exception as e:
+                    print('When mirror %s, %s' % (seq, e))
+                    continue
+                imgDir = os.path.normpath(os.path.abspath(entry['imgDir']))
+                if isPackPath(imgDir) or splitArchivePath(imgDir) is not None:
+                    # Already read through a single mapping
+                    continue
+                imgDirs.append((imgDir, entry))
+            with self.lock:
+                self.active = set(imgDir for imgDir, _ in imgDirs)
+            for imgDir, entry in imgDirs:
+                if self.cancelled(generation):
+                    break
+                try:
+                    self.mirrorDir(generation, imgDir, entry)
+                except (IOError, OSError) as e:
+                    print('When mirror %s, %s' % (imgDir, e))
+
+    def mirrorDir(self, generation, imgDir, entry):
+        '''
+        Copy the frames of imgDir which are missing or changed.
+        '''
+        localDir = self.localDir(imgDir)
+        if not os.path.isdir(localDir):
+            os.makedirs(localDir)
+        with self.lock:
+            record = self.dirs.setdefault(imgDir, {'lastUsed': 0, 'files': {}})
+            record['lastUsed'] = time.time()
+            files = dict(record['files'])
+        copied = 0
+        start = time.time()
+        for name, size, mtime in zip(entry['imgNames'], entry['sizes'],
+                                     entry['mtimes']):
+            if self.cancelled(generation):
+                break
+            size, mtime = int(size), float(mtime)
+            if files.get(name) == [mtime, size]:
+                continue
+            self.copyFrame(os.path.join(imgDir, name),
+                           os.path.join(localDir, name))
+            with self.lock:
+                old = record['files'].get(name)
+                if old is not None:
+                    self.usedBytes -= old[1]
+                record['files'][name] = [mtime, size]
+                self.usedBytes += size
+                full = not self.evict()
+            copied += 1
+            if full:
+                # The active sequences alone do not fit
+                break
+        with self.lock:
+            self.saveIndex()
+        if self.log and copied:
+            print('Mirror %d frames of %s in %.1fs' %
+                  (copied, imgDir, time.time() - start))
+
+    def copyFrame(self, src, dst):
+        with self.opener(src, 'rb') as fin:
+            writeAtomic(dst, lambda fout: shutil.copyfileobj(fin, fout,
+                                                             copyChunk),
+                        durable=False)
+
+    def evict(self):
+        '''
+        Drop least recently used image directories until the cap is
+        respected, return False if it can not be.
+        The lock must be held by the caller.
+        '''
+        while self.usedBytes > self.cap:
+            candidates = [(record['lastUsed'], imgDir)
+                          for imgDir, record in self.dirs.items()
+                          if imgDir not in self.active]
+            if not candidates:
+                return False
+            _, imgDir = min(candidates)
+            record = self.dirs.pop(imgDir)
+            self.usedBytes -= self.dirBytes(record)
+            # Readers which got a local path just before fall back to the
+            # source frame
+            shutil.rmtree(self.localDir(imgDir), ignore_errors=True)
+        return True
+
+    def stats(self):
+        with self.lock:
+            return {'dirs': len(self.dirs),
+                    'usedMB': self.usedBytes / (1024.0 * 1024.0),
+                    'capMB': self.cap / (1024.0 * 1024.0)}
+
+
+if __name__ == '__main__':
+    from dataset import DatasetManifest, readFrameRange
+    parser = argparse.ArgumentParser(
+        description='Mirror sequences locally from a simulated remote share.')
+    parser.add_argument('--data', default='./data',
+                        help='data root containing imageFiles')
+    parser.add_argument('--mirror', default=None,
+                        help='mirror directory (default: <data>/cache/mirror)')
+    parser.add_argument('--cap', type=float, default=4096,
+                        help='size cap of the mirror, in MB')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='simulated latency of every open, in seconds')
+    parser.add_argument('--bandwidth', type=float, default=None,
+                        help='simulated read bandwidth, in MB/s')
+    parser.add_argument('seqs', nargs='+', help='sequences to mirror')
+    args = parser.parse_args()
+    manifest = DatasetManifest(
+        os.path.join(args.data, 'imageFiles'),
+        readFrameRange(os.path.join(args.data, 'frameRange.txt')),
+        os.path.join(args.data, 'cache', 'manifest.bin'))
+    mirror = SequenceMirror(
+        manifest, args.mirror or os.path.join(args.data, 'cache', 'mirror'),
+        args.cap, LatencyOpener(args.latency, args.bandwidth))
+    mirror.log = True
+    start = time.time()
+    mirror.setActive(args.seqs)
+    # Let the worker finish the queued job, then stop it
+    mirror.jobs.put(None)
+    mirror.thread.join()
+    print('Done in %.1fs, %s' % (time.time() - start, mirror.stats()))
+    sys.exit(0)
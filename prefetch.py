@@ -0,0 +1,114 @@
+# coding: utf-8
+# python2
+
+from __future__ import print_function
+from PyQt4 import QtCore
+from framecache import frameCache
+
+
+class DecodeTask(QtCore.QRunnable):
+    '''
+    Decode a single frame into the frame cache on a worker thread.
+    QPixmap can only be used on the GUI thread, so the worker stops at QImage.
+    '''
+
+    def __init__(self, prefetcher, generation, frameIdx, imagePath, size):
+        super(DecodeTask, self).__init__()
+        self.prefetcher = prefetcher
+        self.generation = generation
+        self.frameIdx = frameIdx
+        self.imagePath = imagePath
+        self.size = size
+
+    def run(self):
+        # The sequence or the page may have changed while this task was queued
+        if not self.prefetcher.isWanted(self.generation, self.frameIdx):
+            return
+        frame = frameCache.load(self.imagePath, self.size)
+        self.prefetcher.frameDecoded.emit(self.generation, self.frameIdx,
+                                          not frame.isNull())
+
+
+class PagePrefetcher(QtCore.QObject):
+    '''
+    Decode the pages around the current one in background threads.
+
+    `lookAhead` pages are prepared in the direction the user is moving and one
+    page in the opposite direction, so turning back is cheap as well.
+    '''
+
+    # Emitted from worker threads, delivered on the GUI thread (queued)
+    frameDecoded = QtCore.pyqtSignal(int, int, bool)
+
+    def __init__(self, lookAhead=1, parent=None):
+        super(PagePrefetcher, self).__init__(parent)
+        self.lookAhead = lookAhead
+        self.pool = QtCore.QThreadPool(self)
+        self.generation = 0
+        self.imagePaths = []
+        # frame indices already decoded into the frame cache
+        self.ready = set()
+        # frame indices queued or being decoded
+        self.pending = set()
+        # frame indices worth keeping around for the current page
+        self.window = set()
+        # Tile size the frames are decoded for
+        self.size = None
+        self.frameDecoded.connect(self.onFrameDecoded)
+
+    def setSequence(self, imagePaths):
+        '''
+        Forget everything about the previous sequence.
+        Tasks still queued for it will notice the new generation and quit.
+        '''
+        self.generation += 1
+        self.imagePaths = list(imagePaths)
+        self.ready = set()
+        self.pending = set()
+        self.window = set()
+
+    def setLookAhead(self, lookAhead):
+        self.lookAhead = max(0, int(lookAhead))
+
+    def isWanted(self, generation, frameIdx):
+        return generation == self.generation and frameIdx in self.window
+
+    def setPage(self, startIdx, endIdx, direction=1, size=None):
+        '''
+        The page [startIdx, endIdx) is now on screen, prefetch its neighbours
+        decoded for tiles of `size`.
+        '''
+        if size != self.size:
+            # Frames decoded for another tile size may not be good enough
+            self.size = size
+            self.ready = set()
+        pageSize = max(endIdx - startIdx, 1)
+        seqLen = len(self.imagePaths)
+        ahead = self.lookAhead * pageSize
+        if direction >= 0:
+            forward = range(endIdx, min(endIdx + ahead, seqLen))
+            backward = range(max(startIdx - pageSize, 0), startIdx)
+        else:
+            forward = range(max(startIdx - ahead, 0), startIdx)[::-1]
+            backward = range(endIdx, min(endIdx + pageSize, seqLen))
+        order = list(forward) + list(backward)
+
+        self.window = set(range(startIdx, endIdx)) | set(order)
+        # Frames far from the page are left to the LRU policy of the cache
+        self.ready &= self.window
+        self.pending &= self.window
+
+        for frameIdx in order:
+            if frameIdx in self.ready or frameIdx in self.pending:
+                continue
+            self.pending.add(frameIdx)
+            task = DecodeTask(self, self.generation, frameIdx,
+                              self.imagePaths[frameIdx], self.size)
+            self.pool.start(task)
+
+    def onFrameDecoded(self, generation, frameIdx, ok):
+        if generation != self.generation:
+            return
+        self.pending.discard(frameIdx)
+        if ok and frameIdx in self.window:
+            self.ready.add(frameIdx)
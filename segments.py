@@ -0,0 +1,253 @@
+# coding: utf-8
+# python2
+
+'''
+Run-length encoded attribution data.
+
+Attributions come in long runs (an occlusion lasts dozens of frames), so a
+sequence is described by the sorted start frames of its runs and their
+attribute bits. Looking up a frame is a bisect, and labeling a range replaces
+a few runs and merges them with their neighbours.
+
+Print the segments of every annotated sequence with:
+
+    python segments.py [--data ./data] [--attr O]
+'''
+
+from __future__ import print_function
+import os
+import os.path
+import sys
+import argparse
+from bisect import bisect_left, bisect_right
+import numpy as np
+from labels import LabelStore, defaultSchema, readLabels, saveLabels
+
+
+class LabelSegments(object):
+    '''
+    Runs of equal attribute bits: run k covers [starts[k], starts[k + 1]) and
+    has the bits values[k]. Neighbouring runs always have different values.
+    '''
+
+    def __init__(self, starts, values, length):
+        self.starts = list(starts)
+        self.values = list(values)
+        self.length = length
+
+    @classmethod
+    def fromArray(cls, flags):
+        flags = np.asarray(flags)
+        if len(flags) == 0:
+            return cls([], [], 0)
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(flags)) + 1))
+        return cls(starts.tolist(), flags[starts].tolist(), len(flags))
+
+    def toArray(self):
+        lengths = np.diff(self.starts + [self.length])
+        return np.repeat(np.array(self.values, np.uint8), lengths)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def runIndex(self, frameIdx):
+        return bisect_right(self.starts, frameIdx) - 1
+
+    def run(self, k):
+        '''
+        Return (start, end, value) of run k, end is exclusive.
+        '''
+        end = self.starts[k + 1] if k + 1 < len(self.starts) else self.length
+        return self.starts[k], end, self.values[k]
+
+    def valueAt(self, frameIdx):
+        return self.values[self.runIndex(frameIdx)]
+
+    def runAt(self, frameIdx):
+        return self.run(self.runIndex(frameIdx))
+
+    def attrRunAt(self, frameIdx, bit):
+        '''
+        Return [start, end) of the frames around frameIdx which all have the
+        attribute bit (e.g. where this occlusion starts and ends), or None.
+        Runs differing by other attributes are joined.
+        '''
+        k = self.runIndex(frameIdx)
+        if not self.values[k] & bit:
+            return None
+        first = last = k
+        while first > 0 and self.values[first - 1] & bit:
+            first -= 1
+        while last + 1 < len(self.values) and self.values[last + 1] & bit:
+            last += 1
+        return self.run(first)[0], self.run(last)[1]
+
+    def runs(self, bit=None):
+        '''
+        Yield (start, end, value) of all runs, or of the runs with `bit`.
+        '''
+        for k in range(len(self.starts)):
+            if bit is None or self.values[k] & bit:
+                yield self.run(k)
+
+    def find(self, frameIdx, match, step=1):
+        '''
+        Return the first frame after frameIdx (step 1), or the last frame
+        before it (step -1), whose bits satisfy `match`, or None. `match` is
+        applied to an array of run values and returns a boolean array.
+        '''
+        frameIdx += 1 if step > 0 else -1
+        if not 0 <= frameIdx < self.length:
+            return None
+        k = self.runIndex(frameIdx)
+        values = np.array(self.values, np.uint8)
+        if step > 0:
+            hits = np.flatnonzero(match(values[k:]))
+            if len(hits) == 0:
+                return None
+            return max(self.starts[k + hits[0]], frameIdx)
+        hits = np.flatnonzero(match(values[:k + 1]))
+        if len(hits) == 0:
+            return None
+        return min(self.run(hits[-1])[1] - 1, frameIdx)
+
+    def split(self, pos):
+        '''
+        Make sure a run starts at `pos`.
+        '''
+        if pos <= 0 or pos >= self.length:
+            return
+        k = self.runIndex(pos)
+        if self.starts[k] != pos:
+            self.starts.insert(k + 1, pos)
+            self.values.insert(k + 1, self.values[k])
+
+    def assign(self, start, end, value):
+        '''
+        Set the bits of frames [start, end) to value, merging the neighbours.
+        '''
+        start, end = max(start, 0), min(end, self.length)
+        if start >= end:
+            return
+        self.split(start)
+        self.split(end)
+        i = bisect_left(self.starts, start)
+        j = bisect_left(self.starts, end)
+        self.starts[i:j] = [start]
+        self.values[i:j] = [value]
+        if i + 1 < len(self.values) and self.values[i + 1] == value:
+            del self.starts[i + 1]
+            del self.values[i + 1]
+        if i > 0 and self.values[i - 1] == value:
+            del self.starts[i]
+            del self.values[i]
+
+    def slice(self, start, end):
+        '''
+        Return the runs of [start, end) as a list of (start, end, value).
+        '''
+        result = []
+        k = self.runIndex(start)
+        while k < len(self.starts) and self.starts[k] < end:
+            s, e, v = self.run(k)
+            result.append((max(s, start), min(e, end), v))
+            k += 1
+        return result
+
+    def summary(self, schema=defaultSchema):
+        '''
+        Return {short name: (frame count, run count)} and the annotated frame
+        count, computed from the runs only.
+        '''
+        lengths = np.diff(self.starts + [self.length])
+        values = np.array(self.values, np.uint8)
+        result = {}
+        for i, attr in enumerate(schema):
+            has = (values & (1 << i)) != 0
+            # A run of the attribute starts where `has` turns on
+            rises = np.diff(np.concatenate(([0], has.astype(np.int8))))
+            result[attr[0]] = (int(lengths[has].sum()),
+                               int(np.count_nonzero(rises == 1)))
+        return result, int(lengths[values != 0].sum())
+
+
+class LabelHistory(object):
+    '''
+    Undo/redo log of the label changes of a sequence. A change is stored as
+    the runs of the changed interval before and after it, so labeling a
+    thousand frames costs a few runs, not a copy of the labels.
+    '''
+
+    def __init__(self, limit=1000):
+        self.limit = limit
+        # [(runs before, runs after)], the last one is undone first
+        self.done = []
+        self.undone = []
+
+    def record(self, before, after):
+        '''
+        Record a change which has been applied, runs are (start, end, value).
+        '''
+        self.done.append((list(before), list(after)))
+        del self.done[:-self.limit]
+        self.undone = []
+
+    def undo(self):
+        '''
+        Return the runs restoring the labels before the last change, or None.
+        '''
+        if not self.done:
+            return None
+        change = self.done.pop()
+        self.undone.append(change)
+        return change[0]
+
+    def redo(self):
+        '''
+        Return the runs of the last undone change, or None.
+        '''
+        if not self.undone:
+            return None
+        change = self.undone.pop()
+        self.done.append(change)
+        return change[1]
+
+    def clear(self):
+        self.done = []
+        self.undone = []
+
+
+def readSegments(seqAttrFile, seqLen=None, schema=defaultSchema):
+    return LabelSegments.fromArray(readLabels(seqAttrFile, seqLen,
+                                              schema=schema).flags)
+
+
+def saveSegments(seqAttrFile, segments, schema=defaultSchema):
+    saveLabels(seqAttrFile, LabelStore(segments.toArray(), schema))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Print the attribute segments of the annotated sequences.')
+    parser.add_argument('--data', default='./data',
+                        help='data root containing annotateFiles')
+    parser.add_argument('--attr', default=None,
+                        help='only print the runs of this attribute')
+    args = parser.parse_args()
+    attrRoot = os.path.join(args.data, 'annotateFiles')
+    names = [a[0] for a in defaultSchema]
+    bit = None if args.attr is None else 1 << names.index(args.attr)
+    for fn in sorted(os.listdir(attrRoot)):
+        if not fn.endswith('.mat'):
+            continue
+        segments = readSegments(os.path.join(attrRoot, fn[:-4]))
+        counts, annotated = segments.summary()
+        print('%s: %d frames, %d annotated, %s' % (
+            fn[:-4], segments.length, annotated,
+            ', '.join('%s %d frames in %d runs' % (n, counts[n][0], counts[n][1])
+                      for n in names)))
+        for start, end, value in segments.runs(bit):
+            if value:
+                print('    [%d, %d) %s' % (start, end, '+'.join(
+                    n for i, n in enumerate(names) if value & (1 << i))))
+    sys.exit(0)
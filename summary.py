@@ -0,0 +1,213 @@
+# coding: utf-8
+# python2
+
+'''
+Annotation progress of every sequence.
+
+The summary index keeps, for every sequence with attribution data, its frame
+count, annotated frame count, frame count of every attribute, and the mtime
+of its mat file. It is kept in data/cache/summary.json, updated by every save
+of the annotator, and entries which are missing or older than their mat file
+(or journal) are rebuilt from the mat files by a pool of workers. Image data
+is never read.
+
+Rebuild it, or print the progress of every sequence, with:
+
+    python summary.py [--data ./data] [--jobs 4]
+'''
+
+from __future__ import print_function
+import os
+import os.path
+import sys
+import json
+import time
+import argparse
+import threading
+import multiprocessing
+import multiprocessing.pool
+from fileutil import writeAtomic
+from dataset import DatasetManifest, readFrameRange, mtimeOf
+from labels import readLabels, defaultSchema
+from journal import LabelJournal
+
+
+def labelsStamp(seqAttrFile):
+    '''
+    Return what changes when the labels of a sequence are written: the mtime
+    of its mat file and the size of its journal.
+    '''
+    try:
+        journalSize = os.path.getsize(seqAttrFile + '.journal')
+    except OSError:
+        journalSize = 0
+    return mtimeOf(seqAttrFile + '.mat'), journalSize
+
+
+def summarize(labels, stamp):
+    counts, annotated = labels.counts()
+    return {'frames': len(labels), 'annotated': annotated, 'counts': counts,
+            'stamp': list(stamp)}
+
+
+def summarizeFile(job):
+    '''
+    Read the labels of a sequence, run in a worker.
+    Return (seq, summary entry), the entry is None without mat file.
+    '''
+    seq, seqAttrFile, schema = job
+    stamp = labelsStamp(seqAttrFile)
+    if stamp[0] is None:
+        return seq, None
+    try:
+        labels = readLabels(seqAttrFile, None, schema=schema)
+        # Changes not compacted into the mat file yet
+        LabelJournal.replay(seqAttrFile, labels)
+    except Exception as e:
+        print('When summarize %s, %s' % (seqAttrFile, e))
+        return seq, None
+    return seq, summarize(labels, stamp)
+
+
+class SummaryIndex(object):
+    '''
+    seq -> {frames, annotated, counts: {short name: frames}, stamp}.
+    Safe to use from several threads.
+    '''
+
+    def __init__(self, attrRoot, indexFile, schema=defaultSchema):
+        self.attrRoot = attrRoot
+        self.indexFile = indexFile
+        self.schema = schema
+        self.lock = threading.Lock()
+        self.entries = self.readIndex()
+
+    def readIndex(self):
+        try:
+            with open(self.indexFile) as f:
+                index = json.load(f)
+            # Counts of another schema are meaningless
+            if index['schema'] == [attr[0] for attr in self.schema]:
+                return index['seqs']
+        except (IOError, ValueError, KeyError):
+            pass
+        return {}
+
+    def saveIndex(self):
+        '''
+        The lock must be held by the caller.
+        '''
+        indexDir = os.path.dirname(self.indexFile)
+        if indexDir and not os.path.isdir(indexDir):
+            os.makedirs(indexDir)
+        writeAtomic(self.indexFile, lambda f: f.write(json.dumps(
+            {'schema': [attr[0] for attr in self.schema],
+             'seqs': self.entries}, separators=(',', ':')).encode('utf-8')),
+            durable=False)
+
+    def seqAttrFile(self, seq):
+        return os.path.join(self.attrRoot, seq)
+
+    def get(self, seq):
+        with self.lock:
+            return self.entries.get(seq)
+
+    def completion(self, seq):
+        '''
+        Return the annotated fraction of the frames of a sequence, 0 if it has
+        no attribution data.
+        '''
+        entry = self.get(seq)
+        if entry is None or entry['frames'] == 0:
+            return 0.0
+        return entry['annotated'] / float(entry['frames'])
+
+    def update(self, seq, labels, stamp=None):
+        '''
+        Record the labels of a sequence which have just been saved.
+        '''
+        if stamp is None:
+            stamp = labelsStamp(self.seqAttrFile(seq))
+        with self.lock:
+            self.entries[seq] = summarize(labels, stamp)
+            self.saveIndex()
+
+    def outdated(self, seqs):
+        '''
+        Return the sequences whose entry is missing or stale.
+        '''
+        todo = []
+        for seq in seqs:
+            stamp = list(labelsStamp(self.seqAttrFile(seq)))
+            entry = self.get(seq)
+            if stamp[0] is None and entry is None:
+                # Not annotated yet
+                continue
+            if entry is None or entry['stamp'] != stamp:
+                todo.append(seq)
+        return todo
+
+    def rebuild(self, seqs, jobs=None, processes=True, log=False):
+        '''
+        Rebuild the missing and stale entries of `seqs` in a pool of `jobs`
+        workers, processes or threads. Return the rebuilt sequences.
+        '''
+        todo = self.outdated(seqs)
+        if not todo:
+            return []
+        if processes:
+            pool = multiprocessing.Pool(jobs)
+        else:
+            # Forking a GUI process is not safe, reading mat files is mostly
+            # I/O and zlib which release the GIL
+            pool = multiprocessing.pool.ThreadPool(jobs or 4)
+        try:
+            results = pool.imap_unordered(
+                summarizeFile,
+                [(seq, self.seqAttrFile(seq), self.schema) for seq in todo])
+            for seq, entry in results:
+                with self.lock:
+                    if entry is None:
+                        self.entries.pop(seq, None)
+                    else:
+                        self.entries[seq] = entry
+                if log:
+                    print('%s: summarized' % seq)
+            with self.lock:
+                self.saveIndex()
+        finally:
+            pool.close()
+            pool.join()
+        return todo
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Rebuild and print the annotation progress summary.')
+    parser.add_argument('--data', default='./data',
+                        help='data root containing imageFiles and '
+                             'annotateFiles')
+    parser.add_argument('--jobs', type=int, default=None,
+                        help='number of worker processes (default: all cores)')
+    args = parser.parse_args()
+    manifest = DatasetManifest(
+        os.path.join(args.data, 'imageFiles'),
+        readFrameRange(os.path.join(args.data, 'frameRange.txt')),
+        os.path.join(args.data, 'cache', 'manifest.bin'))
+    summary = SummaryIndex(os.path.join(args.data, 'annotateFiles'),
+                           os.path.join(args.data, 'cache', 'summary.json'))
+    start = time.time()
+    seqs = manifest.seqNames()
+    rebuilt = summary.rebuild(seqs, args.jobs)
+    print('Summarized %d sequences in %.1fs' %
+          (len(rebuilt), time.time() - start))
+    for seq in seqs:
+        entry = summary.get(seq)
+        if entry is None:
+            print('%-20s not started' % seq)
+            continue
+        print('%-20s %5.1f%%  %d/%d  %s' % (
+            seq, 100.0 * summary.completion(seq), entry['annotated'],
+            entry['frames'], ' '.join('%s:%d' % (attr[0], entry['counts'][
+                attr[0]]) for attr in summary.schema)))
+    sys.exit(0)
@@ -0,0 +1,77 @@
+# coding: utf-8
+# python2
+
+'''
+LabelJournal: records replayed on the labels, and compaction after a save.
+'''
+
+from __future__ import print_function
+import os
+from journal import LabelJournal, recordFormat
+from labels import LabelStore
+
+
+def replayed(seqAttrFile, seqLen=8):
+    labels = LabelStore.empty(seqLen)
+    count = LabelJournal.replay(seqAttrFile, labels)
+    return count, labels.flags.tolist()
+
+
+def test_replay_in_order(tmpdir):
+    seqAttrFile = str(tmpdir.join('seq'))
+    journal = LabelJournal(seqAttrFile, durable=False)
+    journal.append(1, 3)
+    journal.appendRange(2, 5, 4)
+    # A later record of the same frame wins
+    journal.append(3, 1)
+    journal.close()
+    assert replayed(seqAttrFile) == (5, [0, 3, 4, 1, 4, 0, 0, 0])
+
+
+def test_replay_ignores_cut_record_and_frames_past_the_end(tmpdir):
+    seqAttrFile = str(tmpdir.join('seq'))
+    journal = LabelJournal(seqAttrFile, durable=False)
+    journal.append(0, 2)
+    journal.append(20, 1)
+    journal.close()
+    with open(seqAttrFile + '.journal', 'ab') as f:
+        f.write(recordFormat.pack(1, 5, 0)[:-3])
+    assert replayed(seqAttrFile) == (1, [2, 0, 0, 0, 0, 0, 0, 0])
+
+
+def test_replay_without_journal(tmpdir):
+    assert replayed(str(tmpdir.join('seq'))) == (0, [0] * 8)
+
+
+def test_compact_keeps_records_after_snapshot(tmpdir):
+    seqAttrFile = str(tmpdir.join('seq'))
+    journal = LabelJournal(seqAttrFile, durable=False)
+    journal.append(0, 1)
+    journal.append(1, 2)
+    # Labels are copied for a save here
+    offset = journal.offset()
+    journal.append(2, 3)
+    journal.append(0, 4)
+    journal.compact(offset)
+    assert os.path.getsize(seqAttrFile + '.journal') == 2 * recordFormat.size
+    assert replayed(seqAttrFile) == (2, [4, 0, 3, 0, 0, 0, 0, 0])
+
+    # Offsets stay valid across compactions, and appending goes on after
+    offset = journal.offset()
+    journal.append(5, 1)
+    journal.compact(offset)
+    assert replayed(seqAttrFile) == (1, [0, 0, 0, 0, 0, 1, 0, 0])
+    # An older snapshot saved late drops nothing
+    journal.compact(offset - recordFormat.size)
+    assert replayed(seqAttrFile)[0] == 1
+
+
+def test_compact_everything_removes_the_journal(tmpdir):
+    seqAttrFile = str(tmpdir.join('seq'))
+    journal = LabelJournal(seqAttrFile)
+    journal.appendRange(0, 4, 1)
+    journal.compact(journal.offset())
+    assert not os.path.exists(seqAttrFile + '.journal')
+    journal.append(6, 2)
+    journal.close()
+    assert replayed(seqAttrFile) == (1, [0, 0, 0, 0, 0, 0, 2, 0])
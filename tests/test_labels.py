@@ -0,0 +1,92 @@
+# coding: utf-8
+# python2
+
+'''
+Legacy 0-4 codes and the attribute bits of LabelStore, in memory and through
+saveLabels/readLabels.
+'''
+
+from __future__ import print_function
+import numpy as np
+import pytest
+from labels import LabelStore, legacyTables, legacyCodes, defaultSchema, \
+    readLabels, saveLabels
+from matfile import readMat
+
+O, D, B = 1, 2, 4
+
+
+def test_legacy_tables():
+    toFlags, toLegacy = legacyTables(defaultSchema)
+    assert toFlags.tolist() == [0, O, D, B, O | B]
+    for code in range(len(legacyCodes)):
+        assert toLegacy[toFlags[code]] == code
+    # Combinations without code get the code covering most attributes
+    assert toLegacy[O | D] == 1
+    assert toLegacy[O | D | B] == 4
+    assert toLegacy[D | B] == 2
+
+
+def test_legacy_round_trip():
+    codes = [0, 1, 2, 3, 4, 4, 0, 1]
+    labels = LabelStore.fromLegacy(codes)
+    assert labels.flags.tolist() == [0, O, D, B, O | B, O | B, 0, O]
+    assert labels.toLegacy()[0].tolist() == codes
+    assert labels.toLegacy()[1]
+
+
+def test_lossy_combinations_are_not_exact():
+    labels = LabelStore(np.array([O | D, B, D | B, O | D | B], np.uint8))
+    codes, exact = labels.toLegacy()
+    assert codes.tolist() == [1, 3, 2, 4]
+    assert not exact
+
+
+def test_from_legacy_length():
+    # Padded up to seqLen, and codes past seqLen are kept
+    assert LabelStore.fromLegacy([1, 2], 4).flags.tolist() == [O, D, 0, 0]
+    assert LabelStore.fromLegacy([1, 2, 3], 2).flags.tolist() == [O, D, B]
+    assert len(LabelStore.fromLegacy([], 3)) == 3
+
+
+@pytest.mark.parametrize('codes', [[0, 5], [7], [1, -1]])
+def test_from_legacy_rejects_unknown_codes(codes):
+    with pytest.raises(ValueError):
+        LabelStore.fromLegacy(codes, 4)
+
+
+def test_save_exact_labels(tmpdir):
+    seqAttrFile = str(tmpdir.join('seq'))
+    saveLabels(seqAttrFile, LabelStore.fromLegacy([0, 1, 4, 3]))
+    mat = readMat(seqAttrFile)
+    # Only the legacy column, as the legacy tools wrote it
+    assert sorted(mat) == ['label']
+    assert mat['label'].shape == (4, 1)
+    assert mat['label'].ravel().tolist() == [0, 1, 4, 3]
+    assert readLabels(seqAttrFile, 4).flags.tolist() == [0, O, O | B, B]
+
+
+def test_save_lossy_labels_keeps_flags(tmpdir):
+    seqAttrFile = str(tmpdir.join('seq'))
+    flags = [O | D, 0, D | B, O | D | B, B]
+    saveLabels(seqAttrFile, LabelStore(np.array(flags, np.uint8)))
+    mat = readMat(seqAttrFile)
+    assert sorted(mat) == ['flags', 'label']
+    # Legacy tools still read the closest code
+    assert mat['label'].ravel().tolist() == [1, 0, 2, 4, 3]
+    assert readLabels(seqAttrFile, 5).flags.tolist() == flags
+
+
+def test_read_keeps_frames_past_seq_len(tmpdir):
+    seqAttrFile = str(tmpdir.join('seq'))
+    for flags in ([1, 2, 3, 4], [O | D, 0, B, B]):
+        labels = LabelStore(np.array(flags, np.uint8))
+        saveLabels(seqAttrFile, labels)
+        read = readLabels(seqAttrFile, 2)
+        assert read.flags.tolist() == labels.flags.tolist()
+        assert readLabels(seqAttrFile, 6).flags.tolist() == \
+            labels.flags.tolist() + [0, 0]
+
+
+def test_read_without_mat_file(tmpdir):
+    assert readLabels(str(tmpdir.join('seq')), 3).flags.tolist() == [0] * 3
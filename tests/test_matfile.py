@@ -0,0 +1,117 @@
+# coding: utf-8
+# python2
+
+'''
+matfile.py against scipy.io. The fixtures were written by
+scipy.io.savemat(f, {name: array}, do_compression=True) with SciPy 1.2.3, so
+the byte-level checks run without SciPy.
+'''
+
+from __future__ import print_function
+import io
+import base64
+import numpy as np
+import pytest
+from matfile import readMat, parseMat, writeMat, MatFileError
+
+# savemat(f, {'label': labelArray}, do_compression=True)
+labelFixture = base64.b64decode(
+    'TUFUTEFCIDUuMCBNQVQtZmlsZSBQbGF0Zm9ybTogcG9zaXgsIENyZWF0ZWQgb246'
+    'IFN1biBPY3QgMTggMDk6MTE6MTcgMjAyNgAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+    'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAABSU0PAAAAOAAAAHic42NgYKgA'
+    'YjYg5gBiPgYIYIXyQZgRikFiOYlJqTlAmgeIHRgQgBGNZoLSzAyogB2NBgAK2wMg')
+labelArray = np.array([0, 1, 1, 2, 3, 0, 7, 7], np.int64).reshape(-1, 1)
+
+# savemat(f, {'flags': flagsArray}, do_compression=True)
+flagsFixture = base64.b64decode(
+    'TUFUTEFCIDUuMCBNQVQtZmlsZSBQbGF0Zm9ybTogcG9zaXgsIENyZWF0ZWQgb246'
+    'IFN1biBPY3QgMTggMDk6MTE6MTcgMjAyNgAAAAAAAAAAAAAAAAAAAAAAAAAAAAAA'
+    'AAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAAABSU0PAAAAMQAAAHic42NgYHAA'
+    'YjYg5gBiTgYIYIXyQZgRikFiaTmJ6cVAmgkqx8DIyMTKwM4OAEy5ArA=')
+flagsArray = np.array([0, 1, 1, 2, 5, 0, 7, 7], np.uint8).reshape(-1, 1)
+
+fixtures = [('label', labelArray, labelFixture),
+            ('flags', flagsArray, flagsFixture)]
+
+
+def written(variables, compress=True):
+    f = io.BytesIO()
+    writeMat(f, variables, compress)
+    return f.getvalue()
+
+
+@pytest.mark.parametrize('name,array,fixture', fixtures)
+def test_write_matches_savemat_bytes(name, array, fixture):
+    data = written({name: array})
+    # Only the creation date of the header text differs
+    assert data[:36] == fixture[:36]
+    assert data[116:] == fixture[116:]
+
+
+@pytest.mark.parametrize('name,array,fixture', fixtures)
+def test_read_savemat_bytes(name, array, fixture):
+    mat = parseMat(fixture)
+    assert list(mat) == [name]
+    assert mat[name].dtype == array.dtype
+    assert np.array_equal(mat[name], array)
+
+
+def test_round_trip(tmpdir):
+    variables = {'label': labelArray, 'flags': flagsArray,
+                 'logical': np.array([True, False, True]),
+                 'matrix': np.arange(6.0).reshape(2, 3)}
+    for compress in (True, False):
+        path = str(tmpdir.join('seq.mat'))
+        with open(path, 'wb') as f:
+            writeMat(f, variables, compress)
+        # '.mat' is appended like loadmat does
+        mat = readMat(path[:-4])
+        assert sorted(mat) == sorted(variables)
+        assert np.array_equal(mat['matrix'], variables['matrix'])
+        assert mat['logical'].dtype == bool
+        assert mat['logical'].shape == (1, 3)
+
+
+def test_not_a_mat_file():
+    with pytest.raises(MatFileError):
+        parseMat('not a mat file')
+    with pytest.raises(MatFileError):
+        # Truncated in the middle of the element
+        parseMat(labelFixture[:-8])
+
+
+@pytest.mark.parametrize('compress', [True, False])
+def test_scipy_reads_written(tmpdir, compress):
+    sio = pytest.importorskip('scipy.io')
+    path = str(tmpdir.join('seq.mat'))
+    with open(path, 'wb') as f:
+        writeMat(f, {'label': labelArray, 'flags': flagsArray}, compress)
+    mat = sio.loadmat(path)
+    for name, array in [('label', labelArray), ('flags', flagsArray)]:
+        assert mat[name].dtype == array.dtype
+        assert np.array_equal(mat[name], array)
+
+
+@pytest.mark.parametrize('compress', [True, False])
+def test_read_scipy_written(tmpdir, compress):
+    sio = pytest.importorskip('scipy.io')
+    variables = {'label': labelArray, 'flags': flagsArray,
+                 'logical': np.array([[True], [False]]),
+                 'matrix': np.arange(6, dtype=np.float32).reshape(3, 2)}
+    path = str(tmpdir.join('seq.mat'))
+    sio.savemat(path, variables, do_compression=compress)
+    mat = readMat(path)
+    assert sorted(mat) == sorted(variables)
+    for name, array in variables.items():
+        assert mat[name].dtype == array.dtype
+        assert np.array_equal(mat[name], array)
+
+
+@pytest.mark.parametrize('compress', [True, False])
+def test_write_matches_savemat(compress):
+    sio = pytest.importorskip('scipy.io')
+    for name, array, _ in fixtures:
+        expected = io.BytesIO()
+        sio.savemat(expected, {name: array}, do_compression=compress)
+        assert written({name: array}, compress)[116:] == \
+            expected.getvalue()[116:]
@@ -0,0 +1,133 @@
+# coding: utf-8
+# python2
+
+'''
+LabelSegments and LabelHistory against the plain label arrays they describe.
+'''
+
+from __future__ import print_function
+import numpy as np
+import pytest
+from segments import LabelSegments, LabelHistory
+
+flags = np.array([0, 0, 1, 1, 1, 0, 4, 4, 5, 0], np.uint8)
+
+
+def runs(segments):
+    return list(segments.runs())
+
+
+def checkRuns(segments):
+    '''
+    Neighbouring runs always have different values.
+    '''
+    assert all(a != b for a, b in zip(segments.values, segments.values[1:]))
+
+
+def test_from_array():
+    segments = LabelSegments.fromArray(flags)
+    assert runs(segments) == [(0, 2, 0), (2, 5, 1), (5, 6, 0), (6, 8, 4),
+                              (8, 9, 5), (9, 10, 0)]
+    assert np.array_equal(segments.toArray(), flags)
+    assert len(LabelSegments.fromArray([])) == 0
+
+
+@pytest.mark.parametrize('start,end,value', [
+    (0, 10, 0), (0, 10, 3), (5, 6, 1), (2, 5, 0), (6, 9, 4), (1, 3, 1),
+    (9, 10, 5), (0, 1, 2), (3, 7, 1), (4, 4, 7), (-3, 2, 1), (8, 20, 0)])
+def test_assign_matches_array(start, end, value):
+    segments = LabelSegments.fromArray(flags)
+    segments.assign(start, end, value)
+    expected = flags.copy()
+    expected[max(start, 0):end] = value
+    assert np.array_equal(segments.toArray(), expected)
+    assert runs(segments) == runs(LabelSegments.fromArray(expected))
+    checkRuns(segments)
+
+
+def test_assign_merges_neighbours():
+    segments = LabelSegments.fromArray(flags)
+    # Fills the gap between two runs of 1
+    segments.assign(5, 6, 1)
+    segments.assign(6, 8, 1)
+    assert runs(segments)[:2] == [(0, 2, 0), (2, 8, 1)]
+    # Joins the first run with the frames cleared after it
+    segments.assign(2, 8, 0)
+    assert runs(segments)[0] == (0, 8, 0)
+    checkRuns(segments)
+
+
+def test_find_at_run_boundaries():
+    segments = LabelSegments.fromArray(flags)
+    has1 = lambda values: (values & 1) != 0
+    has4 = lambda values: (values & 4) != 0
+    unannotated = lambda values: values == 0
+    # Forward from the frame before a run starts, and from inside a run
+    assert segments.find(1, has1) == 2
+    assert segments.find(2, has1) == 3
+    assert segments.find(4, has1) == 8
+    assert segments.find(5, has4) == 6
+    assert segments.find(8, has1) is None
+    # Backward from the frame after a run ends, and from inside a run
+    assert segments.find(5, has1, -1) == 4
+    assert segments.find(3, has1, -1) == 2
+    assert segments.find(2, has1, -1) is None
+    assert segments.find(6, unannotated, -1) == 5
+    # Past either end
+    assert segments.find(9, unannotated) is None
+    assert segments.find(0, unannotated, -1) is None
+
+
+def test_slice():
+    segments = LabelSegments.fromArray(flags)
+    assert segments.slice(3, 7) == [(3, 5, 1), (5, 6, 0), (6, 7, 4)]
+    assert segments.slice(0, 10) == runs(segments)
+    assert segments.slice(6, 8) == [(6, 8, 4)]
+
+
+def test_attr_run_joins_other_attributes():
+    segments = LabelSegments.fromArray(flags)
+    # Frames 6-8 all have bit 4, whatever their other bits
+    assert segments.attrRunAt(8, 4) == (6, 9)
+    assert segments.attrRunAt(5, 4) is None
+
+
+def test_undo_redo_round_trip():
+    segments = LabelSegments.fromArray(flags)
+    history = LabelHistory()
+    states = [segments.toArray()]
+    for start, end, change in [(1, 7, lambda v: v | 2), (4, 10, lambda v: 0),
+                               (0, 3, lambda v: v ^ 1)]:
+        before = segments.slice(start, end)
+        after = [(s, e, change(v)) for s, e, v in before]
+        history.record(before, after)
+        for s, e, v in after:
+            segments.assign(s, e, v)
+        states.append(segments.toArray())
+
+    def apply(changes):
+        for s, e, v in changes:
+            segments.assign(s, e, v)
+
+    for state in reversed(states[:-1]):
+        apply(history.undo())
+        assert np.array_equal(segments.toArray(), state)
+    assert history.undo() is None
+    for state in states[1:]:
+        apply(history.redo())
+        assert np.array_equal(segments.toArray(), state)
+    assert history.redo() is None
+    checkRuns(segments)
+
+
+def test_record_drops_redo_and_keeps_limit():
+    history = LabelHistory(limit=2)
+    for i in range(3):
+        history.record([(i, i + 1, 0)], [(i, i + 1, 1)])
+    assert history.undo() == [(2, 3, 0)]
+    history.record([(5, 6, 0)], [(5, 6, 2)])
+    assert history.redo() is None
+    assert history.undo() == [(5, 6, 0)]
+    assert history.undo() == [(1, 2, 0)]
+    # The first change was dropped by the limit
+    assert history.undo() is None
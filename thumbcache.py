@@ -0,0 +1,204 @@
+# coding: utf-8
+# python2
+
+'''
+Persistent on-disk thumbnail cache.
+
+Thumbnails of data/imageFiles/<seq>/img/<frame> are stored as
+data/cache/thumbs/<seq>/<frame>.jpg, with an index.json per sequence which
+records the mtime, byte size and full resolution of every source frame.
+
+Pre-generate (or update) the cache with:
+
+    python thumbcache.py [--data ./data] [--jobs 4] [--size 640x480]
+
+The tool is incremental and resumable: frames whose mtime and size did not
+change are skipped, and the index is saved regularly while it runs.
+'''
+
+from __future__ import print_function
+import os
+import os.path
+import sys
+import json
+import argparse
+import threading
+import multiprocessing
+from dataset import validExt
+from fileutil import writeAtomic
+
+# Default bounding size of a thumbnail, enough for a 3x3 grid on 1080p
+thumbSize = (640, 480)
+
+# Save the index every that many generated thumbnails
+indexSaveInterval = 200
+
+
+def makeThumb(job):
+    '''
+    Create one thumbnail, run in a worker process.
+    Return (frame name, [mtime, size, full width, full height]) or
+    (frame name, None) if the source can not be decoded.
+    '''
+    from PIL import Image
+    srcPath, dstPath, size = job
+    name = os.path.basename(srcPath)
+    try:
+        st = os.stat(srcPath)
+        img = Image.open(srcPath)
+        fullSize = img.size
+        if img.format == 'JPEG':
+            # Let libjpeg do most of the downscaling
+            img.draft('RGB', size)
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        img.thumbnail(size, Image.ANTIALIAS)
+        writeAtomic(dstPath, lambda f: img.save(f, 'JPEG', quality=90),
+                    durable=False)
+    except (IOError, OSError) as e:
+        print('When create thumbnail for %s, ' % srcPath)
+        print(e)
+        return name, None
+    return name, [st.st_mtime, st.st_size, fullSize[0], fullSize[1]]
+
+
+class ThumbnailStore(object):
+    '''
+    Access to the thumbnails of every sequence of the dataset.
+    '''
+
+    def __init__(self, cacheRoot, imageRoot, size=thumbSize):
+        self.cacheRoot = cacheRoot
+        self.imageRoot = os.path.normpath(os.path.abspath(imageRoot))
+        self.size = tuple(size)
+        # sequence directory name -> index dict, loaded lazily
+        self.indexes = {}
+        self.lock = threading.Lock()
+
+    def seqName(self, imagePath):
+        '''
+        Return the dataset directory name owning `imagePath`, or None.
+        '''
+        rel = os.path.relpath(os.path.abspath(imagePath), self.imageRoot)
+        parts = rel.split(os.sep)
+        if len(parts) < 2 or parts[0] == os.pardir:
+            return None
+        return parts[0]
+
+    def seqDir(self, seq):
+        return os.path.join(self.cacheRoot, seq)
+
+    def thumbPath(self, seq, name):
+        return os.path.join(self.seqDir(seq), name.rsplit('.', 1)[0] + '.jpg')
+
+    def indexFile(self, seq):
+        return os.path.join(self.seqDir(seq), 'index.json')
+
+    def readIndex(self, seq):
+        '''
+        Return the index of a sequence, an empty one if missing, stale or of
+        another thumbnail size.
+        '''
+        try:
+            with open(self.indexFile(seq)) as f:
+                index = json.load(f)
+            if tuple(index['size']) == self.size:
+                return index
+        except (IOError, ValueError, KeyError):
+            pass
+        return {'size': list(self.size), 'frames': {}}
+
+    def saveIndex(self, seq, index):
+        if not os.path.isdir(self.seqDir(seq)):
+            os.makedirs(self.seqDir(seq))
+        writeAtomic(self.indexFile(seq), lambda f: f.write(
+            json.dumps(index, separators=(',', ':')).encode('utf-8')),
+            durable=False)
+
+    def index(self, seq):
+        with self.lock:
+            index = self.indexes.get(seq)
+            if index is None:
+                index = self.readIndex(seq)
+                self.indexes[seq] = index
+            return index
+
+    def lookup(self, imagePath, mtime):
+        '''
+        Return (thumbnail path, (full width, full height)) of a frame if an up
+        to date thumbnail exists, else None.
+        '''
+        seq = self.seqName(imagePath)
+        if seq is None:
+            return None
+        name = os.path.basename(imagePath)
+        entry = self.index(seq)['frames'].get(name)
+        if entry is None or entry[0] != mtime:
+            return None
+        return self.thumbPath(seq, name), (entry[2], entry[3])
+
+    def outdated(self, seq, imgDir, index):
+        '''
+        Yield the jobs of frames in imgDir whose thumbnail is missing or stale.
+        '''
+        for name in sorted(os.listdir(imgDir)):
+            if not any(name.endswith(ext) for ext in validExt):
+                continue
+            srcPath = os.path.join(imgDir, name)
+            st = os.stat(srcPath)
+            entry = index['frames'].get(name)
+            dstPath = self.thumbPath(seq, name)
+            if entry is not None and entry[0] == st.st_mtime and \
+                    entry[1] == st.st_size and os.path.exists(dstPath):
+                continue
+            yield srcPath, dstPath, self.size
+
+    def generate(self, jobs=None, log=True):
+        '''
+        Create the missing thumbnails of the whole dataset in a process pool.
+        '''
+        pool = multiprocessing.Pool(jobs)
+        try:
+            for seq in sorted(os.listdir(self.imageRoot)):
+                imgDir = os.path.join(self.imageRoot, seq, 'img')
+                if not os.path.isdir(imgDir):
+                    continue
+                index = self.readIndex(seq)
+                todo = list(self.outdated(seq, imgDir, index))
+                if not todo:
+                    continue
+                if not os.path.isdir(self.seqDir(seq)):
+                    os.makedirs(self.seqDir(seq))
+                if log:
+                    print('%s: %d thumbnails to create' % (seq, len(todo)))
+                done = 0
+                for name, entry in pool.imap_unordered(makeThumb, todo, 8):
+                    if entry is not None:
+                        index['frames'][name] = entry
+                    done += 1
+                    if done % indexSaveInterval == 0:
+                        # Keep the progress if the tool is interrupted
+                        self.saveIndex(seq, index)
+                self.saveIndex(seq, index)
+                with self.lock:
+                    self.indexes[seq] = index
+        finally:
+            pool.close()
+            pool.join()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Pre-generate the thumbnail cache of the dataset.')
+    parser.add_argument('--data', default='./data',
+                        help='data root containing imageFiles')
+    parser.add_argument('--jobs', type=int, default=None,
+                        help='number of worker processes (default: all cores)')
+    parser.add_argument('--size', default='%dx%d' % thumbSize,
+                        help='bounding size of a thumbnail, WxH')
+    args = parser.parse_args()
+    size = tuple(int(v) for v in args.size.lower().split('x'))
+    store = ThumbnailStore(os.path.join(args.data, 'cache', 'thumbs'),
+                           os.path.join(args.data, 'imageFiles'), size)
+    store.generate(args.jobs)
+    sys.exit(0)
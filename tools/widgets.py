@@ -3,6 +3,7 @@
 
 import os
 import math
+import threading
 from PyQt4 import QtCore, QtGui
 
 THUMB_WIDTH = 128
@@ -277,3 +278,405 @@ class ImageContainer(QtGui.QFrame):
     def setSelected(self, id):
         print('ImageContainer -> setSelected    ', id)
         self.ImageWidgetList[str(id)].setSelected()
+
+
+class ThumbLoader(QtCore.QObject):
+    """
+    Decode thumbnails in a thread pool, QImage can be used off the GUI thread.
+    """
+    # generation, item index, requested size, image
+    loaded = QtCore.pyqtSignal(int, int, int, QtGui.QImage)
+
+    def __init__(self, parent=None):
+        super(ThumbLoader, self).__init__(parent)
+        self.pool = QtCore.QThreadPool(self)
+        self.pool.setMaxThreadCount(max(QtCore.QThread.idealThreadCount(), 2))
+        # (generation, index, size) of the queued tasks still wanted, shared
+        # with the pool threads
+        self.wanted = set()
+        self.lock = threading.Lock()
+
+    def request(self, generation, index, path, size):
+        with self.lock:
+            self.wanted.add((generation, index, size))
+        self.pool.start(ThumbTask(self, generation, index, path, size))
+
+    def cancel(self, generation, index, size):
+        """
+        The queued task is skipped without decoding.
+        """
+        with self.lock:
+            self.wanted.discard((generation, index, size))
+
+    def take(self, generation, index, size):
+        """
+        Called by a task before decoding, return whether it is still wanted.
+        """
+        with self.lock:
+            try:
+                self.wanted.remove((generation, index, size))
+            except KeyError:
+                return False
+            return True
+
+    def clear(self):
+        self.pool.clear()
+        with self.lock:
+            self.wanted.clear()
+
+
+class ThumbTask(QtCore.QRunnable):
+
+    def __init__(self, loader, generation, index, path, size):
+        super(ThumbTask, self).__init__()
+        self.loader = loader
+        self.generation = generation
+        self.index = index
+        self.path = path
+        self.size = size
+
+    def run(self):
+        if not self.loader.take(self.generation, self.index, self.size):
+            # Scrolled away or zoomed since it was queued
+            return
+        reader = QtGui.QImageReader(self.path)
+        full = reader.size()
+        if full.isValid():
+            # JPEG files are decoded directly at a reduced scale
+            reader.setScaledSize(full.scaled(self.size, self.size,
+                                             QtCore.Qt.KeepAspectRatio))
+        self.loader.loaded.emit(self.generation, self.index, self.size,
+                                reader.read())
+
+
+class VirtualImageArea(QtGui.QAbstractScrollArea):
+    """
+    Thumbnail grid for thousands of images. Items are plain data, only the
+    visible cells are painted, and their position is computed from the index,
+    so scrolling and zooming do not depend on the number of items.
+    Thumbnails of the visible rows (and a margin around them) are decoded in
+    background at the cell size, the others are dropped.
+    """
+
+    def __init__(self):
+        super(VirtualImageArea, self).__init__()
+        self.widget_w = THUMB_WIDTH
+        self.widget_h = THUMB_HEIGHT
+        self.min_width = THUMB_MIN
+        self.max_height = THUMB_MAX
+        self.asset_space = 2
+        self.edge_size = 5
+        # Rows above and below the viewport whose thumbnails are kept
+        self.margin_rows = 2
+
+        self.bg_color = QtGui.QColor(50, 50, 50)
+        self.hightlight = QtGui.QColor(255, 255, 255, 100)
+        self.name_font = QtGui.QFont()
+        self.pen_selected = QtGui.QPen(QtGui.QColor(255, 255, 0))
+        self.pen_selected.setWidth(self.edge_size)
+        self.pen_selected.setJoinStyle(QtCore.Qt.MiterJoin)
+
+        # [(id, display text, image path)]
+        self.items = []
+        # item index -> (decoded size, QImage)
+        self.thumbs = {}
+        # item index -> requested size
+        self.pending = {}
+        self.selected = None
+        self.hightlighted = None
+        # Thumbnails decoded for a previous item list are ignored
+        self.generation = 0
+
+        self.loader = ThumbLoader(self)
+        self.loader.loaded.connect(self.onThumbLoaded)
+        # Decode at the final size once zooming stops
+        self.zoomTimer = QtCore.QTimer(self)
+        self.zoomTimer.setSingleShot(True)
+        self.zoomTimer.setInterval(150)
+        self.zoomTimer.timeout.connect(self.requestThumbs)
+
+        self.viewport().setMouseTracking(True)
+        self.verticalScrollBar().valueChanged.connect(self.onScrolled)
+        self.setHorizontalScrollBarPolicy(QtCore.Qt.ScrollBarAlwaysOff)
+
+    def setItems(self, items):
+        """
+        Show [(id, display text, image path)].
+        """
+        self.loader.clear()
+        self.generation += 1
+        self.items = list(items)
+        self.thumbs.clear()
+        self.pending.clear()
+        self.selected = None
+        self.hightlighted = None
+        self.updateLayout()
+
+    def setPaths(self, paths):
+        self.setItems([(i, os.path.basename(path), path)
+                       for i, path in enumerate(paths)])
+
+    def clearAll(self):
+        self.setItems([])
+
+    # Layout, everything is derived from the index of an item
+    def cellWidth(self):
+        return self.widget_w + self.asset_space
+
+    def cellHeight(self):
+        return self.widget_h + self.asset_space
+
+    def columns(self):
+        w = self.viewport().width() - self.asset_space * 2
+        return max(w // self.cellWidth(), 1)
+
+    def rows(self):
+        return -(-len(self.items) // self.columns())
+
+    def itemRect(self, index):
+        row, col = divmod(index, self.columns())
+        return QtCore.QRect(
+            self.asset_space * 2 + col * self.cellWidth(),
+            self.asset_space * 2 + row * self.cellHeight()
+            - self.verticalScrollBar().value(),
+            self.widget_w, self.widget_h)
+
+    def visibleRange(self, margin_rows=0):
+        """
+        Return [first, last) indexes of the items in the viewport, plus
+        margin_rows rows above and below.
+        """
+        top = self.verticalScrollBar().value() - self.asset_space * 2
+        first_row = max(top // self.cellHeight() - margin_rows, 0)
+        last_row = (top + self.viewport().height()) // self.cellHeight() + \
+            1 + margin_rows
+        cols = self.columns()
+        return (min(first_row * cols, len(self.items)),
+                min(last_row * cols, len(self.items)))
+
+    def indexAt(self, pos):
+        x = pos.x() - self.asset_space * 2
+        y = pos.y() - self.asset_space * 2 + self.verticalScrollBar().value()
+        if x < 0 or y < 0:
+            return None
+        col, row = x // self.cellWidth(), y // self.cellHeight()
+        if col >= self.columns():
+            return None
+        index = row * self.columns() + col
+        if index >= len(self.items) or \
+                not self.itemRect(index).contains(pos):
+            return None
+        return index
+
+    def updateLayout(self):
+        """
+        Update the scroll range, nothing is moved.
+        """
+        height = self.rows() * self.cellHeight() + self.asset_space * 4
+        bar = self.verticalScrollBar()
+        bar.setRange(0, max(height - self.viewport().height(), 0))
+        bar.setPageStep(self.viewport().height())
+        bar.setSingleStep(max(self.cellHeight() // 4, 1))
+        self.requestThumbs()
+        self.viewport().update()
+
+    def resizeEvent(self, event):
+        super(VirtualImageArea, self).resizeEvent(event)
+        self.updateLayout()
+
+    def setItemSize(self, size):
+        # Keep the first visible item at the top
+        anchor = self.visibleRange()[0]
+        self.widget_w = size
+        self.widget_h = size
+        height = self.rows() * self.cellHeight() + self.asset_space * 4
+        bar = self.verticalScrollBar()
+        bar.setRange(0, max(height - self.viewport().height(), 0))
+        bar.setValue(anchor // self.columns() * self.cellHeight())
+        self.viewport().update()
+        self.zoomTimer.start()
+
+    def changeItemSize(self, mount):
+        size = min(max(self.widget_w + mount, self.min_width), self.max_height)
+        self.setItemSize(size)
+
+    def onScrolled(self, value):
+        self.requestThumbs()
+        self.viewport().update()
+
+    # Lazy thumbnails
+    def requestThumbs(self):
+        """
+        Decode the missing thumbnails around the viewport, drop the others.
+        """
+        first, last = self.visibleRange(self.margin_rows)
+        size = self.widget_w
+        for index in self.thumbs.keys():
+            if not first <= index < last:
+                del self.thumbs[index]
+        for index in self.pending.keys():
+            if not first <= index < last:
+                self.loader.cancel(self.generation, index,
+                                   self.pending.pop(index))
+        # Visible items first
+        visible = range(*self.visibleRange())
+        for index in visible + range(first, last):
+            thumb = self.thumbs.get(index)
+            if thumb is not None and thumb[0] >= size:
+                continue
+            pending = self.pending.get(index, 0)
+            if pending >= size:
+                continue
+            if pending:
+                # Zoomed in, the smaller thumbnail is not needed any more
+                self.loader.cancel(self.generation, index, pending)
+            self.pending[index] = size
+            self.loader.request(self.generation, index,
+                                self.items[index][2], size)
+
+    def onThumbLoaded(self, generation, index, size, image):
+        if generation != self.generation or self.pending.get(index) != size:
+            # Scrolled away or zoomed meanwhile
+            return
+        del self.pending[index]
+        self.thumbs[index] = (size, image)
+        rect = self.itemRect(index)
+        if rect.intersects(self.viewport().rect()):
+            self.viewport().update(rect)
+
+    def paintEvent(self, event):
+        painter = QtGui.QPainter(self.viewport())
+        first, last = self.visibleRange()
+        for index in range(first, last):
+            rect = self.itemRect(index)
+            if rect.intersects(event.rect()):
+                self.paintItem(painter, index, rect)
+
+    def paintItem(self, painter, index, rect):
+        name_height = max(rect.height() * 0.15, 20)
+        painter.fillRect(rect, self.bg_color)
+        thumb = self.thumbs.get(index)
+        if thumb is not None:
+            image = thumb[1]
+            target = QtCore.QSize(image.size())
+            target.scale(rect.size(), QtCore.Qt.KeepAspectRatio)
+            x = rect.x() + (rect.width() - target.width()) / 2
+            y = rect.y() + (rect.height() - target.height()) / 2
+            painter.drawImage(QtCore.QRect(QtCore.QPoint(x, y), target), image)
+        if index == self.hightlighted and index != self.selected:
+            painter.fillRect(rect, self.hightlight)
+        painter.setPen(QtGui.QPen(QtGui.QColor(255, 255, 255)))
+        self.name_font.setPixelSize(name_height)
+        painter.setFont(self.name_font)
+        painter.drawText(rect.x() + self.edge_size,
+                         rect.bottom() - self.edge_size * 2,
+                         str(self.items[index][1]))
+        if index == self.selected:
+            painter.setPen(self.pen_selected)
+            painter.setBrush(QtCore.Qt.NoBrush)
+            painter.drawRect(rect.adjusted(self.edge_size / 2,
+                                           self.edge_size / 2,
+                                           -self.edge_size / 2,
+                                           -self.edge_size / 2))
+
+    # Mouse
+    def updateItem(self, index):
+        if index is not None:
+            self.viewport().update(self.itemRect(index))
+
+    def mouseMoveEvent(self, event):
+        index = self.indexAt(event.pos())
+        if index != self.hightlighted:
+            self.updateItem(self.hightlighted)
+            self.hightlighted = index
+            self.updateItem(index)
+
+    def leaveEvent(self, event):
+        self.updateItem(self.hightlighted)
+        self.hightlighted = None
+
+    def mouseReleaseEvent(self, event):
+        if event.button() == QtCore.Qt.LeftButton:
+            index = self.indexAt(event.pos())
+            if index is not None:
+                self.setSelectedIndex(index)
+
+    def mouseDoubleClickEvent(self, event):
+        index = self.indexAt(event.pos())
+        if index is not None:
+            self.emit(QtCore.SIGNAL('doubleClick'), self.items[index][0])
+
+    def setSelectedIndex(self, index):
+        self.updateItem(self.selected)
+        self.selected = index
+        self.updateItem(index)
+        self.emit(QtCore.SIGNAL("click"), self.items[index][0])
+
+    # 设定指定id为选中状态
+    def setSelected(self, id):
+        for index, item in enumerate(self.items):
+            if item[0] == id:
+                self.ensureVisible(index)
+                self.setSelectedIndex(index)
+                return
+
+    def ensureVisible(self, index):
+        rect = self.itemRect(index)
+        bar = self.verticalScrollBar()
+        if rect.top() < 0:
+            bar.setValue(bar.value() + rect.top() - self.asset_space * 2)
+        elif rect.bottom() > self.viewport().height():
+            bar.setValue(bar.value() + rect.bottom() -
+                         self.viewport().height() + self.asset_space * 2)
+
+
+class VirtualImageContainer(QtGui.QFrame):
+    """
+    Drop-in replacement of ImageContainer for long sequences, the images are
+    given as paths instead of widgets.
+    """
+
+    def __init__(self, paths=None):
+        super(VirtualImageContainer, self).__init__()
+
+        containerLayout = QtGui.QVBoxLayout()
+
+        self.zoomSlider = QtGui.QSlider()
+        self.zoomSlider.setOrientation(QtCore.Qt.Horizontal)
+        self.zoomSlider.setMinimum(THUMB_MIN)
+        self.zoomSlider.setMaximum(THUMB_MAX)
+        self.zoomSlider.setValue(THUMB_WIDTH)
+        self.zoomSlider.setFixedWidth(128)
+        self.zoomSlider.setFixedHeight(10)
+
+        self.item_area = VirtualImageArea()
+        self.zoomSlider.valueChanged.connect(self.item_area.setItemSize)
+        # Forward the item signals, as ImageContainer users expect them
+        for signal in ('click', 'doubleClick'):
+            QtCore.QObject.connect(self.item_area, QtCore.SIGNAL(signal),
+                                   lambda id, signal=signal:
+                                   self.emit(QtCore.SIGNAL(signal), id))
+
+        containerLayout.addWidget(self.zoomSlider)
+        containerLayout.addWidget(self.item_area)
+        self.setLayout(containerLayout)
+        if paths is not None:
+            self.setPaths(paths)
+
+    def setItems(self, items):
+        self.item_area.setItems(items)
+
+    def setPaths(self, paths):
+        self.item_area.setPaths(paths)
+
+    def clearAll(self):
+        self.item_area.clearAll()
+
+    def changeItemSize(self, mount):
+        self.item_area.changeItemSize(mount)
+
+    def setItemSize(self, size):
+        self.zoomSlider.setValue(size)
+
+    def setSelected(self, id):
+        self.item_area.setSelected(id)
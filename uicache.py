@@ -0,0 +1,82 @@
+# coding: utf-8
+# python2
+
+'''
+Cached Python module generated from a Qt Designer file.
+
+uic.loadUiType parses the .ui file and generates the form class on every
+launch. loadUiType below generates ui_<name>.py next to the .ui file once,
+and imports it (from its .pyc) as long as the .ui file keeps its mtime.
+'''
+
+from __future__ import print_function
+import os
+import os.path
+import imp
+from PyQt4 import QtGui
+from fileutil import writeAtomic
+
+# First lines of the generated module, read to check it is up to date
+headerFormat = '# coding: utf-8\n# uiMtime: %r\n# uiForm: %s\n# uiBase: %s\n'
+
+
+def modulePath(uiFile):
+    uiDir, fn = os.path.split(uiFile)
+    return os.path.join(uiDir, 'ui_%s.py' % os.path.splitext(fn)[0])
+
+
+def readHeader(pyFile):
+    '''
+    Return (ui mtime, form class name, base class name) of a generated
+    module, or None.
+    '''
+    try:
+        with open(pyFile) as f:
+            lines = [f.readline() for _ in range(4)]
+        mtime = float(lines[1].split(':', 1)[1])
+        return mtime, lines[2].split(':', 1)[1].strip(), \
+            lines[3].split(':', 1)[1].strip()
+    except (IOError, IndexError, ValueError):
+        return None
+
+
+def compileModule(uiFile, pyFile):
+    '''
+    Generate the module of uiFile. The uic compiler is only imported here.
+    '''
+    from xml.etree import cElementTree
+    from PyQt4 import uic
+    root = cElementTree.parse(uiFile).getroot()
+    formName = 'Ui_' + root.find('class').text
+    baseName = root.find('widget').get('class')
+    header = headerFormat % (os.path.getmtime(uiFile), formName, baseName)
+
+    def writer(f):
+        f.write(header)
+        uic.compileUi(uiFile, f)
+    writeAtomic(pyFile, writer, 'w', durable=False)
+
+
+def loadUiType(uiFile):
+    '''
+    Return (form class, base class) of uiFile, like uic.loadUiType.
+    '''
+    pyFile = modulePath(uiFile)
+    header = readHeader(pyFile)
+    try:
+        if header is None or header[0] != os.path.getmtime(uiFile):
+            compileModule(uiFile, pyFile)
+            header = readHeader(pyFile)
+    except (IOError, OSError) as e:
+        # e.g. a read-only checkout
+        print('When generate %s, %s' % (pyFile, e))
+        from PyQt4 import uic
+        return uic.loadUiType(uiFile)
+    name = os.path.splitext(os.path.basename(pyFile))[0]
+    f, path, description = imp.find_module(
+        name, [os.path.dirname(os.path.abspath(pyFile))])
+    try:
+        module = imp.load_module(name, f, path, description)
+    finally:
+        f.close()
+    return getattr(module, header[1]), getattr(QtGui, header[2])